@@ -0,0 +1,93 @@
+"""Micro-benchmark of `parse_message` against the previous chain of regex substitutions.
+
+Run from the repository root:
+
+    python benchmarks/parse_benchmark.py [number of messages]
+"""
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src", "slack_native"))
+
+import emoji_data_python  # noqa: E402
+
+from messages import parse  # noqa: E402
+
+
+def fetch_emojis(emoji_names):
+    # resolve custom emojis from memory, so neither implementation touches the network
+    return {emoji_name: f"tmp/{emoji_name}.png" for emoji_name in emoji_names}
+
+
+parse.emoji_index.paths = fetch_emojis
+
+bold_pattern = re.compile(r'\*(.*?)\*')
+italic_pattern = re.compile(r'_(.*?)_')
+strikethrough_pattern = re.compile(r'~(.*?)~')
+link_pattern = re.compile(r'<(https?://\S+)(\|.*?)?>')
+channel_pattern = re.compile(r'#(\w+)')
+emoji_pattern = re.compile(r':(\w+):')
+
+
+def legacy_parse_message(text):
+    """The regex chain `parse_message` used before the single-pass renderer."""
+    text = bold_pattern.sub(r'<b>\1</b>', text)
+    text = italic_pattern.sub(r'<i>\1</i>', text)
+    text = strikethrough_pattern.sub(r'<del>\1</del>', text)
+    text = link_pattern.sub(r'<a href="\1">\2</a>', text)
+    text = channel_pattern.sub(r'<span class="channel">#\1</span>', text)
+    text = emoji_data_python.replace_colons(text, False)
+    emoji_urls = fetch_emojis(tuple(emoji_pattern.findall(text)))
+    return re.sub(emoji_pattern,
+                  lambda match: f'<img src="{emoji_urls.get(match.group(1))}" alt="{match.group(1)}" '
+                                f'width="20" height="20">', text)
+
+
+WORDS = ("the", "deploy", "is", "done", "can", "you", "check", "logs", "for", "staging", "thanks", "looks", "good",
+         "to", "me", "I", "think", "we", "should", "ship", "it", "after", "lunch", "meeting", "moved", "tomorrow")
+FRAGMENTS = [
+    "*bold text*", "_italic text_", "~struck out~", "`inline code`",
+    "```\nsome_code(block, *args)\n```",
+    "<https://example.com/some_path/with_underscores|a link>", "<https://example.com/page>",
+    "<@U012AB3CD>", "<#C012AB3CD|general>", "<!here>", "#random",
+    ":smile:", ":thumbsup::skin-tone-3:", ":partyparrot:", "snake_case_name", "10:30",
+]
+
+
+def make_corpus(size: int, markup_ratio: float, seed: int = 0) -> list[str]:
+    """Generate distinct messages (so neither implementation can be served by a cache) of plain words, with about
+    `markup_ratio` of the words replaced by formatting, links, mentions or emojis."""
+    rng = random.Random(seed)
+    return [f"{i} " + " ".join(rng.choice(FRAGMENTS) if rng.random() < markup_ratio else rng.choice(WORDS)
+                               for _ in range(rng.randint(3, 30)))
+            for i in range(size)]
+
+
+def measure(func, corpus: list[str]) -> float:
+    start = time.perf_counter()
+    for text in corpus:
+        func(text)
+    return time.perf_counter() - start
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # "chat" is closer to real channel history; "dense" is nothing but markup, the worst case for the tokenizer
+    for corpus_name, markup_ratio in (("plain", 0.0), ("chat", 0.1), ("dense", 1.0)):
+        corpus = make_corpus(size, markup_ratio)
+        total_bytes = sum(len(text) for text in corpus)
+        results = {
+            "legacy": measure(legacy_parse_message, corpus),
+            "single_pass": measure(parse.parse_message, corpus),
+        }
+        print(f"{corpus_name} corpus ({size} messages, {total_bytes / 1e6:.1f} MB)")
+        for name, elapsed in results.items():
+            print(f"{name:>12}: {size / elapsed:10.0f} messages/s  {total_bytes / elapsed / 1e6:6.2f} MB/s")
+        print(f"     speedup: {results['legacy'] / results['single_pass']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""A local stand-in for Slack's Socket Mode endpoint, to run the event listener without a network or a Slack app.
+
+It speaks just enough of the websocket protocol (RFC 6455) for slack_sdk's built-in client: the handshake, text
+frames, pings and closes. Envelopes are pushed with `send_event`; the listener's acknowledgements are recorded, and
+`drop` cuts the connection to make the listener reconnect.
+"""
+import base64
+import hashlib
+import itertools
+import json
+import socket
+import struct
+import threading
+import time
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+def recv_exactly(connection: socket.socket, size: int) -> bytes:
+    data = b""
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+    return data
+
+
+def read_frame(connection: socket.socket) -> tuple[int, bytes]:
+    """Read one (masked, as clients send them) frame; returns its opcode and payload."""
+    first, second = recv_exactly(connection, 2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack("!H", recv_exactly(connection, 2))
+    elif length == 127:
+        length, = struct.unpack("!Q", recv_exactly(connection, 8))
+    mask = recv_exactly(connection, 4) if second & 0x80 else b"\0\0\0\0"
+    payload = recv_exactly(connection, length)
+    return first & 0x0F, bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+
+
+def frame(opcode: int, payload: bytes) -> bytes:
+    """An unmasked frame, as servers send them."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+class SocketModeServer:
+    """Serves Socket Mode on a free local port, from daemon threads.
+
+    It also stands in for the Web API client that issues the websocket URL (`apps.connections.open`), so it can be
+    passed to `SocketModeListener` as its `web_client`.
+    """
+
+    # read by slack_sdk's client from its web client, for wss:// URLs
+    ssl = None
+
+    def __init__(self):
+        self._server = socket.create_server(("127.0.0.1", 0))
+        self.port = self._server.getsockname()[1]
+        self._condition = threading.Condition()
+        self._connection: socket.socket | None = None
+        self._envelope_ids = itertools.count(1)
+        # the number of websocket connections opened so far
+        self.connections = 0
+        # envelope id -> when it was acknowledged
+        self.acks: dict[str, float] = {}
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def apps_connections_open(self, app_token: str, **_) -> dict:
+        return {"ok": True, "url": f"ws://127.0.0.1:{self.port}/link"}
+
+    def _accept(self):
+        while True:
+            try:
+                connection, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=[connection], daemon=True).start()
+
+    def _serve(self, connection: socket.socket):
+        try:
+            request = b""
+            while b"\r\n\r\n" not in request:
+                chunk = connection.recv(4096)
+                if not chunk:
+                    return
+                request += chunk
+            headers = dict(line.split(": ", 1) for line in request.decode().split("\r\n")[1:] if ": " in line)
+            key = {name.lower(): value for name, value in headers.items()}["sec-websocket-key"]
+            accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+            connection.sendall(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                                f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+            connection.sendall(frame(OPCODE_TEXT, json.dumps({"type": "hello", "num_connections": 1}).encode()))
+            with self._condition:
+                self._connection = connection
+                self.connections += 1
+                self._condition.notify_all()
+            while True:
+                opcode, payload = read_frame(connection)
+                if opcode == OPCODE_TEXT:
+                    envelope_id = json.loads(payload).get("envelope_id")
+                    if envelope_id is not None:
+                        with self._condition:
+                            self.acks[envelope_id] = time.perf_counter()
+                            self._condition.notify_all()
+                elif opcode == OPCODE_PING:
+                    connection.sendall(frame(OPCODE_PONG, payload))
+                elif opcode == OPCODE_CLOSE:
+                    connection.sendall(frame(OPCODE_CLOSE, payload[:2]))
+                    return
+        except (OSError, ValueError, KeyError):
+            return
+        finally:
+            with self._condition:
+                if self._connection is connection:
+                    self._connection = None
+            connection.close()
+
+    def wait_connected(self, connections: int = 1, timeout: float = 10):
+        """Wait until `connections` websockets have been opened in total."""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.connections >= connections and self._connection is not None,
+                                            timeout):
+                raise TimeoutError(f"the listener didn't connect (connection {connections})")
+
+    def send_event(self, event: dict, event_id: str) -> str:
+        """Deliver an `events_api` envelope; returns its envelope id."""
+        envelope_id = f"envelope-{next(self._envelope_ids)}"
+        envelope = {"envelope_id": envelope_id, "type": "events_api", "accepts_response_payload": False,
+                    "payload": {"type": "event_callback", "event_id": event_id, "event": event}}
+        with self._condition:
+            self._connection.sendall(frame(OPCODE_TEXT, json.dumps(envelope).encode()))
+        return envelope_id
+
+    def wait_acked(self, envelope_ids: list[str], timeout: float = 10):
+        with self._condition:
+            if not self._condition.wait_for(lambda: all(envelope_id in self.acks for envelope_id in envelope_ids),
+                                            timeout):
+                missing = [envelope_id for envelope_id in envelope_ids if envelope_id not in self.acks]
+                raise TimeoutError(f"envelopes weren't acknowledged: {missing}")
+
+    def drop(self):
+        """Cut the current connection without a close frame, as a network failure would."""
+        with self._condition:
+            connection = self._connection
+            self._connection = None
+        if connection is not None:
+            connection.shutdown(socket.SHUT_RDWR)
+
+    def close(self):
+        self.drop()
+        self._server.close()
@@ -0,0 +1,415 @@
+"""Benchmarks of the message pipeline against a synthetic workspace, with the results written out as JSON.
+
+Each scenario runs in its own process, with a fresh app data directory and an offscreen Qt platform. Its first pass
+therefore runs with cold stores and caches, and its second pass with warm ones. Run from the repository root:
+
+    python benchmarks/suite.py [--channels 20] [--users 200] [--messages 200] [--threads 10] [--replies 5]
+                               [--emojis 50] [--latency-ms 0] [--scenario NAME ...] [--output results.json]
+                               [--baseline previous.json] [--tolerance 0.2]
+
+With `--baseline`, each pass's throughput is compared to an earlier run. The exit status is 1 if any pass got
+slower by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(BENCHMARKS_DIR, "..", "src")
+sys.path.insert(0, os.path.join(SOURCE_DIR, "slack_native"))
+sys.path.insert(0, SOURCE_DIR)
+
+from workspace import Workspace, WorkspaceClient, WorkspaceConfig, start_asset_server  # noqa: E402
+
+# characters of a failed scenario's stderr kept in the results
+STDERR_KEPT = 4000
+
+
+def summarize(latencies: list[float], items: int) -> dict:
+    """Throughput and latency of a pass; each latency is one operation, which handled `items` in total."""
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        "operations": len(latencies),
+        "items": items,
+        "total_s": total,
+        "items_per_s": items / total if total else 0.0,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": latencies[len(latencies) // 2] * 1000,
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+        "max_ms": latencies[-1] * 1000,
+    }
+
+
+def timed(func, *args) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def run_coroutine(coroutine):
+    """Run a coroutine of the app on the Qt event loop until it's done, and return its result."""
+    from PySide6.QtCore import QEventLoop
+    from qt_async_threads import QtAsyncRunner
+
+    loop = QEventLoop()
+    outcome = {}
+
+    async def wrapper():
+        try:
+            outcome["result"] = await coroutine
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            loop.quit()
+
+    runner = QtAsyncRunner()
+    runner.start_coroutine(wrapper())
+    if "result" not in outcome and "error" not in outcome:
+        loop.exec()
+    runner.close()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def history_page(workspace: Workspace, channel_id: str) -> list[dict]:
+    """A copy of the newest page of a channel, oldest first, as the app holds it before annotating it."""
+    from common import HISTORY_PAGE_SIZE
+    return [dict(message) for message in reversed(workspace.history[channel_id][:HISTORY_PAGE_SIZE])]
+
+
+def passes(run_pass, names=("cold", "warm")) -> dict:
+    return {name: run_pass() for name in names}
+
+
+def bench_parse_message(workspace: Workspace, client: WorkspaceClient) -> dict:
+    # its emoji data is loaded on first use; that is startup cost, not parsing
+    import emoji_data_python  # noqa: F401
+    from messages.parse import parse_message
+
+    texts = {channel_id: [message["text"] for message in messages] for channel_id, messages in workspace.history.items()}
+
+    def run_pass():
+        latencies = [timed(lambda batch: [parse_message(text) for text in batch], batch)[0]
+                     for batch in texts.values()]
+        result = summarize(latencies, sum(len(batch) for batch in texts.values()))
+        result["bytes_per_s"] = sum(len(text) for batch in texts.values() for text in batch) / result["total_s"]
+        return result
+
+    return passes(run_pass)
+
+
+def bench_render_cache(workspace: Workspace, client: WorkspaceClient) -> dict:
+    import emoji_data_python  # noqa: F401
+    from common import APP_DATA_DIR
+    from messages.render_cache import RenderCache
+
+    path = os.path.join(APP_DATA_DIR, "benchmark_rendered.db")
+    pages = {channel["id"]: history_page(workspace, channel["id"]) for channel in workspace.channels}
+
+    def run_pass(cache: RenderCache):
+        latencies = [timed(cache.render, channel_id, messages)[0] for channel_id, messages in pages.items()]
+        return summarize(latencies, sum(len(messages) for messages in pages.values()))
+
+    cache = RenderCache(path)
+    results = {"cold": run_pass(cache), "warm": run_pass(cache)}
+    # a new session: nothing in memory, everything on disk
+    reopened = RenderCache(path)
+    results["disk"] = run_pass(reopened)
+    results["stats"] = reopened.stats()
+    return results
+
+
+def bench_apply_additional_properties(workspace: Workspace, client: WorkspaceClient) -> dict:
+    from messages.fetch import apply_additional_properties
+
+    def run_pass():
+        latencies = []
+        items = 0
+        for channel in workspace.channels:
+            messages = history_page(workspace, channel["id"])
+            latencies.append(timed(run_coroutine, apply_additional_properties(client, messages, channel["id"]))[0])
+            items += len(messages)
+        return summarize(latencies, items)
+
+    return passes(run_pass)
+
+
+def bench_fetch_messages(workspace: Workspace, client: WorkspaceClient) -> dict:
+    from messages.fetch import fetch_messages
+
+    def run_pass():
+        latencies = []
+        items = 0
+        for channel in workspace.channels:
+            elapsed, messages = timed(run_coroutine, fetch_messages(client, channel["id"]))
+            latencies.append(elapsed)
+            items += len(messages)
+        return summarize(latencies, items)
+
+    return passes(run_pass)
+
+
+def bench_fetch_replies(workspace: Workspace, client: WorkspaceClient) -> dict:
+    from messages.fetch import fetch_replies
+
+    threads = workspace.threads()
+    if not threads:
+        return {}
+
+    def run_pass():
+        latencies = []
+        items = 0
+        for channel_id, parent in threads:
+            elapsed, messages = timed(run_coroutine,
+                                      fetch_replies(client, channel_id, parent["ts"], parent.get("latest_reply")))
+            latencies.append(elapsed)
+            items += len(messages)
+        return summarize(latencies, items)
+
+    return passes(run_pass)
+
+
+def bench_render_messages(workspace: Workspace, client: WorkspaceClient) -> dict:
+    from PySide6.QtWidgets import QApplication
+    from messages.fetch import fetch_messages
+    from messages.render import render_messages
+    from ui.widgets.messages_view import MessagesView
+
+    pages = {channel["id"]: run_coroutine(fetch_messages(client, channel["id"])) for channel in workspace.channels}
+    view = MessagesView()
+    view.resize(800, 900)
+    view.show()
+
+    def show(messages: list[dict]):
+        run_coroutine(render_messages(view, messages, replace=True))
+        QApplication.processEvents()
+        # paint synchronously, so the time includes laying out and drawing the visible rows
+        view.viewport().repaint()
+
+    def run_pass():
+        latencies = [timed(show, messages)[0] for messages in pages.values()]
+        return summarize(latencies, sum(len(messages) for messages in pages.values()))
+
+    return passes(run_pass)
+
+
+def bench_directory_sync(workspace: Workspace, client: WorkspaceClient) -> dict:
+    from users.directory import sync_directory
+
+    def run_pass():
+        elapsed, counts = timed(sync_directory, client)
+        return {**summarize([elapsed], counts["seen"]), "changed": counts["changed"]}
+
+    return passes(run_pass)
+
+
+def bench_emoji_sync(workspace: Workspace, client: WorkspaceClient) -> dict:
+    from messages.emojis import emoji_index
+
+    def run_pass():
+        elapsed, changed = timed(emoji_index.sync, client)
+        return {**summarize([elapsed], len(workspace.emojis)), "changed": len(changed)}
+
+    return passes(run_pass)
+
+
+def bench_socket_mode(workspace: Workspace, client: WorkspaceClient) -> dict:
+    """Events delivered over a local stub Socket Mode server, with the connection dropped halfway through.
+
+    Also checks the listener's contract, and fails the scenario if it's broken: every envelope is acknowledged,
+    a redelivered event is handled once, and the listener reconnects by itself.
+    """
+    import threading
+    from types import SimpleNamespace
+    # imported first, as in the app; `signals`, which `events` imports, can't be imported before it
+    import ui  # noqa: F401
+    from events import SocketModeListener
+    from socket_mode import SocketModeServer
+
+    channel_id = workspace.channels[0]["id"]
+    events = [{"type": "message", "channel": channel_id, **message} for message in history_page(workspace, channel_id)]
+    # the ts of each handled event
+    handled = []
+    condition = threading.Condition()
+
+    def post(event: dict):
+        with condition:
+            handled.append(event["ts"])
+            condition.notify_all()
+
+    def deliver(event: dict, event_id: str) -> tuple[float, str]:
+        with condition:
+            times_handled = handled.count(event["ts"])
+            start = time.perf_counter()
+            envelope_id = server.send_event(event, event_id)
+            if not condition.wait_for(lambda: handled.count(event["ts"]) > times_handled, 10):
+                raise TimeoutError(f"event {event_id} wasn't handled")
+        return time.perf_counter() - start, envelope_id
+
+    server = SocketModeServer()
+    listener = SocketModeListener("xapp-benchmark", SimpleNamespace(update_bus=SimpleNamespace(post=post)),
+                                  web_client=server, ping_interval=1)
+    try:
+        listener.start()
+        server.wait_connected()
+        latencies, envelope_ids = [], []
+        for i, event in enumerate(events):
+            if i == len(events) // 2:
+                server.drop()
+                server.wait_connected(2)
+            elapsed, envelope_id = deliver(event, f"event-{i}")
+            latencies.append(elapsed)
+            envelope_ids.append(envelope_id)
+        # Slack redelivers envelopes it considers unacknowledged; the event must not be handled twice
+        envelope_ids.append(server.send_event(events[-1], f"event-{len(events) - 1}"))
+        # whereas the same message under a new event id is a new event; also flushes the redelivery through
+        elapsed, envelope_id = deliver(events[0], "event-last")
+        envelope_ids.append(envelope_id)
+        server.wait_acked(envelope_ids)
+    finally:
+        listener.close()
+        server.close()
+    # the listener's workers are done once it's closed
+    if handled != [event["ts"] for event in events] + [events[0]["ts"]]:
+        raise AssertionError(f"{len(handled)} events handled, expected each of {len(events)} once, then the first again")
+    return {"events": {**summarize(latencies, len(latencies)), "acked": len(server.acks),
+                       "connections": server.connections}}
+
+
+SCENARIOS = {
+    "parse_message": bench_parse_message,
+    "render_cache": bench_render_cache,
+    "apply_additional_properties": bench_apply_additional_properties,
+    "fetch_messages": bench_fetch_messages,
+    "fetch_replies": bench_fetch_replies,
+    "render_messages": bench_render_messages,
+    "directory_sync": bench_directory_sync,
+    "emoji_sync": bench_emoji_sync,
+    "socket_mode": bench_socket_mode,
+}
+
+
+def run_scenario(name: str, config: WorkspaceConfig, latency: float) -> dict:
+    """Run one scenario in this process; the app data directory must already point somewhere empty."""
+    from PySide6.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication([])
+    server = start_asset_server()
+    workspace = Workspace(config, f"http://127.0.0.1:{server.server_port}")
+    client = WorkspaceClient(workspace, latency)
+    try:
+        result = SCENARIOS[name](workspace, client)
+    finally:
+        server.shutdown()
+    result["api_calls"] = dict(client.calls)
+    app.processEvents()
+    return result
+
+
+def run_isolated(name: str, config: WorkspaceConfig, latency: float) -> dict:
+    """Run a scenario in a child process with its own app data directory, and return its result."""
+    with tempfile.TemporaryDirectory(prefix="slack_native_bench_") as home:
+        env = dict(os.environ, HOME=home, LOCALAPPDATA=home, QT_QPA_PLATFORM="offscreen")
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run-scenario", name,
+             "--config", json.dumps(asdict(config)), "--latency-ms", str(latency * 1000)],
+            env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        # the end of the child's stderr, which has the traceback
+        return {"error": f"exited with status {completed.returncode}", "stderr": completed.stderr[-STDERR_KEPT:]}
+    # the app may print along the way; the result is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BENCHMARKS_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """The passes whose throughput dropped by more than `tolerance` compared to `baseline`."""
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        for pass_name, current in scenario.items():
+            previous = baseline.get("scenarios", {}).get(name, {}).get(pass_name)
+            if not isinstance(current, dict) or not isinstance(previous, dict):
+                continue
+            if not current.get("items_per_s") or not previous.get("items_per_s"):
+                continue
+            ratio = current["items_per_s"] / previous["items_per_s"]
+            print(f"{name}.{pass_name}: {ratio:.2f}x of baseline", file=sys.stderr)
+            if ratio < 1 - tolerance:
+                regressions.append(f"{name}.{pass_name}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    defaults = WorkspaceConfig()
+    for field, value in asdict(defaults).items():
+        parser.add_argument(f"--{field.replace('_', '-')}", type=type(value), default=value)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="added to every API call")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="run only these scenarios")
+    parser.add_argument("--output", help="write the results here instead of to stdout")
+    parser.add_argument("--baseline", help="results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="slowdown allowed before failing, e.g. 0.2")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    latency = args.latency_ms / 1000
+
+    if args.run_scenario:
+        config = WorkspaceConfig(**json.loads(args.config))
+        print(json.dumps(run_scenario(args.run_scenario, config, latency)))
+        return
+
+    config = WorkspaceConfig(**{field: getattr(args, field) for field in asdict(defaults)})
+    results = {
+        "meta": {
+            "workspace": asdict(config),
+            "latency_ms": args.latency_ms,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "scenarios": {},
+    }
+    for name in args.scenario or SCENARIOS:
+        print(f"Running {name}...", file=sys.stderr)
+        results["scenarios"][name] = run_isolated(name, config, latency)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    failed = [name for name, scenario in results["scenarios"].items() if "error" in scenario]
+    if failed:
+        print(f"Failed: {', '.join(failed)}", file=sys.stderr)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Slower than the baseline: {', '.join(regressions)}", file=sys.stderr)
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
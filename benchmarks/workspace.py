@@ -0,0 +1,199 @@
+"""A synthetic Slack workspace, served by an in-memory client, for benchmarking without a network or a Slack account.
+
+Profile pictures and custom emojis point at a local HTTP server, so the download paths are exercised too.
+"""
+import random
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the", "deploy", "is", "done", "can", "you", "check", "logs", "for", "staging", "thanks", "looks", "good",
+         "to", "me", "I", "think", "we", "should", "ship", "it", "after", "lunch", "meeting", "moved", "tomorrow")
+FRAGMENTS = (
+    "*bold text*", "_italic text_", "~struck out~", "`inline code`", "```\nsome_code(block, *args)\n```",
+    "<https://example.com/some_path/with_underscores|a link>", "<https://example.com/page>", "<!here>", "#random",
+    ":smile:", ":thumbsup::skin-tone-3:", "snake_case_name", "10:30",
+)
+# the square renditions of a profile picture that Slack serves
+AVATAR_SIZES = (24, 32, 48, 72, 192, 512)
+
+
+@dataclass
+class WorkspaceConfig:
+    channels: int = 20
+    users: int = 200
+    # messages per channel
+    messages: int = 200
+    # threads per channel
+    threads: int = 10
+    # replies per thread
+    replies: int = 5
+    emojis: int = 50
+    # share of the words in a message that are formatting, links, mentions or emojis
+    markup_ratio: float = 0.1
+    seed: int = 0
+
+
+class Workspace:
+    """Channels, users, messages, threads and custom emojis, generated from a seed so every run sees the same data."""
+
+    def __init__(self, config: WorkspaceConfig, asset_url: str):
+        self.config = config
+        rng = random.Random(config.seed)
+        self.emojis = {f"custom{i}": f"{asset_url}/emoji/custom{i}.png" for i in range(config.emojis)}
+        # a few aliases, as real workspaces have
+        for i in range(0, config.emojis, 10):
+            self.emojis[f"alias{i}"] = f"alias:custom{i}"
+        self.users = [self._user(i, asset_url) for i in range(config.users)]
+        self.channels = [{"id": f"C{i:06}", "name": f"channel-{i}", "is_channel": True, "updated": 1_700_000_000_000 + i}
+                         for i in range(config.channels)]
+        # channel -> messages, newest first (as `conversations.history` returns them)
+        self.history: dict[str, list[dict]] = {}
+        # (channel, thread ts) -> the parent followed by its replies, oldest first
+        self.replies: dict[tuple[str, str], list[dict]] = {}
+        for channel in self.channels:
+            self._fill_channel(rng, channel["id"])
+
+    @staticmethod
+    def _user(i: int, asset_url: str) -> dict:
+        user_id = f"U{i:06}"
+        profile = {"real_name": f"User {i}", "display_name": f"user{i}"}
+        for size in AVATAR_SIZES:
+            profile[f"image_{size}"] = f"{asset_url}/avatar/{user_id}_{size}.png"
+        return {"id": user_id, "name": f"user{i}", "updated": 1_700_000_000 + i, "profile": profile}
+
+    def _text(self, rng: random.Random) -> str:
+        fragments = FRAGMENTS + tuple(f":{name}:" for name in list(self.emojis)[:5]) + (
+            f"<@{rng.choice(self.users)['id']}>",)
+        return " ".join(rng.choice(fragments) if rng.random() < self.config.markup_ratio else rng.choice(WORDS)
+                        for _ in range(rng.randint(3, 30)))
+
+    def _message(self, rng: random.Random, ts: float) -> dict:
+        message = {"type": "message", "ts": f"{ts:.6f}", "user": rng.choice(self.users)["id"], "text": self._text(rng)}
+        if rng.random() < 0.05:
+            message["edited"] = {"user": message["user"], "ts": f"{ts + 60:.6f}"}
+        return message
+
+    def _fill_channel(self, rng: random.Random, channel_id: str):
+        start = 1_700_000_000.0
+        messages = [self._message(rng, start + i * 60) for i in range(self.config.messages)]
+        for parent in rng.sample(messages, min(self.config.threads, len(messages))):
+            parent_ts = float(parent["ts"])
+            replies = [dict(self._message(rng, parent_ts + j + 1), thread_ts=parent["ts"])
+                       for j in range(self.config.replies)]
+            parent.update(thread_ts=parent["ts"], reply_count=len(replies),
+                          latest_reply=replies[-1]["ts"] if replies else parent["ts"])
+            self.replies[(channel_id, parent["ts"])] = [parent, *replies]
+        self.history[channel_id] = list(reversed(messages))
+
+    def threads(self) -> list[tuple[str, dict]]:
+        """(channel, parent message) of every thread."""
+        return [(channel_id, thread[0]) for (channel_id, _), thread in self.replies.items()]
+
+
+def page(items: list, cursor: str | None, limit: int) -> tuple[list, str]:
+    start = int(cursor or 0)
+    end = start + limit
+    return items[start:end], str(end) if end < len(items) else ""
+
+
+class WorkspaceClient:
+    """Answers the Web API methods the app uses from a `Workspace`, like `WebClient` but without a network.
+
+    Responses are plain dicts, which the app reads the same way as a `SlackResponse`. `latency` (in seconds) is added
+    to every call, to approximate a round trip to Slack.
+    """
+
+    def __init__(self, workspace: Workspace, latency: float = 0.0):
+        self.workspace = workspace
+        self.latency = latency
+        self.calls: dict[str, int] = {}
+        self._users = {user["id"]: user for user in workspace.users}
+        self._lock = threading.Lock()
+
+    def _call(self, method: str):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if self.latency:
+            threading.Event().wait(self.latency)
+
+    def conversations_history(self, channel: str, limit: int = 100, cursor: str | None = None,
+                              oldest: str | None = None, latest: str | None = None, **_):
+        self._call("conversations_history")
+        messages = self.workspace.history[channel]
+        if oldest is not None:
+            messages = [message for message in messages if float(message["ts"]) > float(oldest)]
+        if latest is not None:
+            messages = [message for message in messages if float(message["ts"]) < float(latest)]
+        messages, next_cursor = page(messages, cursor, limit)
+        return {"ok": True, "messages": [dict(message) for message in messages], "has_more": bool(next_cursor),
+                "response_metadata": {"next_cursor": next_cursor}}
+
+    def conversations_replies(self, channel: str, ts: str, limit: int = 200, cursor: str | None = None, **_):
+        self._call("conversations_replies")
+        messages, next_cursor = page(self.workspace.replies.get((channel, ts), []), cursor, limit)
+        return {"ok": True, "messages": [dict(message) for message in messages], "has_more": bool(next_cursor),
+                "response_metadata": {"next_cursor": next_cursor}}
+
+    def users_info(self, user: str, **_):
+        self._call("users_info")
+        return {"ok": True, "user": self._copy_user(self._users[user])}
+
+    def users_list(self, limit: int = 200, cursor: str | None = None, **_):
+        self._call("users_list")
+        members, next_cursor = page(self.workspace.users, cursor, limit)
+        return {"ok": True, "members": [self._copy_user(user) for user in members],
+                "response_metadata": {"next_cursor": next_cursor}}
+
+    def users_conversations(self, **_):
+        self._call("users_conversations")
+        return {"ok": True, "channels": [dict(channel) for channel in self.workspace.channels]}
+
+    def emoji_list(self, **_):
+        self._call("emoji_list")
+        return {"ok": True, "emoji": dict(self.workspace.emojis)}
+
+    @staticmethod
+    def _copy_user(user: dict) -> dict:
+        return {**user, "profile": dict(user["profile"])}
+
+
+@lru_cache(maxsize=None)
+def png(size: int) -> bytes:
+    """A `size` x `size` PNG, made with Qt so no imaging library is needed."""
+    from PySide6.QtCore import QBuffer, QByteArray, QIODevice
+    from PySide6.QtGui import QColor, QImage
+
+    image = QImage(size, size, QImage.Format.Format_RGB32)
+    image.fill(QColor(74, 21, 75))
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    image.save(buffer, "PNG")
+    buffer.close()
+    return data.data()
+
+
+class AssetHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # /avatar/<user>_<size>.png, or /emoji/<name>.png
+        name = self.path.rsplit("/", 1)[-1].removesuffix(".png")
+        size = int(name.rsplit("_", 1)[1]) if self.path.startswith("/avatar/") else 64
+        body = png(size)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_asset_server() -> ThreadingHTTPServer:
+    """Serve profile pictures and emojis on a free local port, from a daemon thread."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AssetHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -8,4 +8,8 @@ elif CURRENT_SYSTEM == "Linux":
     APP_DATA_DIR = os.path.join(os.environ.get("HOME"), ".config", "slack_native")
 elif CURRENT_SYSTEM == "Darwin":
     # not tested on macOS
-    APP_DATA_DIR = os.path.join(os.environ.get("HOME"), "Library", "Application Support", "slack_native")
\ No newline at end of file
+    APP_DATA_DIR = os.path.join(os.environ.get("HOME"), "Library", "Application Support", "slack_native")
+
+
+# number of messages loaded per page of channel history; can be tuned through the environment
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 20))
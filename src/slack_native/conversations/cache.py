@@ -0,0 +1,26 @@
+import json
+import os
+import threading
+from typing import List
+
+from common import APP_DATA_DIR
+
+channels_path = os.path.join(APP_DATA_DIR, "channels.json")
+
+
+def get_cached_channels() -> List[dict]:
+    """The channel list as it was last fetched, so it can be shown before the network is asked."""
+    try:
+        with open(channels_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def cache_channels(channels: List[dict]):
+    os.makedirs(APP_DATA_DIR, exist_ok=True)
+    # write to a temporary file first, so a crash never leaves a half-written list behind
+    temp_path = f"{channels_path}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(channels, f)
+    os.replace(temp_path, channels_path)
@@ -0,0 +1,70 @@
+import os
+import threading
+from collections import deque
+
+from slack_sdk import WebClient
+from slack_sdk.socket_mode.builtin import SocketModeClient
+from slack_sdk.socket_mode.request import SocketModeRequest
+from slack_sdk.socket_mode.response import SocketModeResponse
+
+from messages.emojis import emoji_index
+from signals import MessagesUpdatedSignal
+
+
+def handle_event(event: dict, messages_manager: MessagesUpdatedSignal):
+    """Merge a Slack event into the local state and tell the UI about it.
+
+    Shared by the `/events/listen` webhook and the Socket Mode listener; may be called from any thread.
+    """
+    if event["type"] == "message":
+        # the new message, edit or deletion is merged into the local history with the rest of its frame's events
+        messages_manager.update_bus.post(event)
+    elif event["type"] == "emoji_changed":
+        emoji_index.apply_event(event)
+
+
+class SocketModeListener:
+    """Receives events over a Socket Mode websocket, so no public HTTP endpoint is needed.
+
+    The connection is re-established automatically when it drops or Slack asks for a refresh. Every envelope is
+    acknowledged before it is handled, as Slack redelivers envelopes that aren't acknowledged within 3 seconds;
+    redeliveries of an already handled event are dropped.
+    """
+
+    def __init__(self, app_token: str, messages_manager: MessagesUpdatedSignal, web_client: WebClient | None = None,
+                 ping_interval: float = 10):
+        self.messages_manager = messages_manager
+        # `web_client` issues the websocket URL (`apps.connections.open`); pointing it elsewhere allows a stub server
+        self.client = SocketModeClient(app_token=app_token, web_client=web_client or WebClient(),
+                                       auto_reconnect_enabled=True, ping_interval=ping_interval)
+        self.client.socket_mode_request_listeners.append(self.on_request)
+        self._handled_event_ids: deque[str] = deque(maxlen=1000)
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.client.connect()
+
+    def close(self):
+        self.client.close()
+
+    def on_request(self, client: SocketModeClient, request: SocketModeRequest):
+        client.send_socket_mode_response(SocketModeResponse(envelope_id=request.envelope_id))
+        if request.type != "events_api":
+            return
+        event_id = request.payload.get("event_id")
+        if event_id is not None:
+            with self._lock:
+                if event_id in self._handled_event_ids:
+                    return
+                self._handled_event_ids.append(event_id)
+        handle_event(request.payload["event"], self.messages_manager)
+
+
+def start_socket_mode(messages_manager: MessagesUpdatedSignal) -> SocketModeListener | None:
+    """Listen for events over Socket Mode if an app-level token (`SLACK_APP_TOKEN`) is configured."""
+    app_token = os.environ.get("SLACK_APP_TOKEN")
+    if not app_token:
+        return None
+    listener = SocketModeListener(app_token, messages_manager)
+    listener.start()
+    return listener
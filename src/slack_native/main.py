@@ -1,30 +1,71 @@
-from ui import main
-from oauth import main as flask_app
+# imported first, so the imports below show up in the startup timeline (set STARTUP_PROFILE=1)
+from utils.startup import startup_timeline
+import sys
+from single_instance import MESSAGE_SHOW, MESSAGE_STATS, listen, notify_running_instance, query_running_instance
+
+if __name__ == '__main__' and "--stats" in sys.argv:
+    # print the running instance's UI stall statistics
+    stats = query_running_instance(MESSAGE_STATS)
+    if stats is None:
+        print("Slack Native isn't running")
+    else:
+        print(stats.decode() if stats else "Slack Native is still starting up")
+    sys.exit(0 if stats is not None else 1)
+
+# a second launch only asks the running instance to show its window, before the rest of the app is imported
+if __name__ == '__main__' and notify_running_instance(MESSAGE_SHOW):
+    print("Another instance is already running")
+    sys.exit(0)
+
+import json
 import threading
-import requests
-from signals import ShowWindowSignal
-import socket
 import faulthandler
+from dotenv import load_dotenv
+
+# loaded up front, as the modules reading the environment are no longer all imported at startup
+load_dotenv(".env")
+with startup_timeline.phase("import ui"):
+    from ui import create_application, main
+from signals import ShowWindowSignal
+from utils.stall_monitor import StallMonitor
 
 
-def instance_running():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        return s.connect_ex(('127.0.0.1', 5000)) == 0
+def start_flask(messages_manager):
+    # Flask is imported here, on its own thread, so it doesn't hold the window up
+    from oauth import main as flask_app
+    flask_app(messages_manager)
+
+
+def listen_over_socket_mode(messages_manager):
+    from events import start_socket_mode
+    # with an app-level token, events arrive over Socket Mode instead of the /events/listen webhook
+    start_socket_mode(messages_manager)
+
+
+def on_instance_message(message: bytes, show_window_signal: ShowWindowSignal, stall_monitor: StallMonitor):
+    if message == MESSAGE_SHOW:
+        show_window_signal.show_window.emit()
+    elif message == MESSAGE_STATS:
+        return json.dumps(stall_monitor.stats()).encode()
 
 
 if __name__ == '__main__':
     faulthandler.enable()
     show_window_signal = ShowWindowSignal()
 
-    if instance_running():
+    app, messages_manager = create_application()
+    # faulthandler covers crashes; this catches the UI freezing, from the first turn of the event loop
+    stall_monitor = StallMonitor(parent=app)
+    stall_monitor.start()
+    # listen before building the UI, so a launch in the meantime hands off to this instance instead of starting another
+    # must keep a reference to the server, otherwise it will be garbage collected
+    instance_server = listen(lambda message: on_instance_message(message, show_window_signal, stall_monitor))
+    if instance_server is None:
         print("Another instance is already running")
-        # make a request to the Flask server, to bring the existing window to the front
-        response = requests.post("http://127.0.0.1:5000/ipc", json={"action": {"window": "show"}})
-        if response.status_code != 200:
-            print("Error bringing the existing window to the front")
-        exit(0)
-    app, window, messages_manager = main(show_window_signal)
-
-    flask_thread = threading.Thread(target=flask_app, args=[messages_manager, show_window_signal])
+        sys.exit(0)
+    window = main(app, messages_manager, show_window_signal)
+
+    flask_thread = threading.Thread(target=start_flask, args=[messages_manager])
     flask_thread.start()
+    threading.Thread(target=listen_over_socket_mode, args=[messages_manager], daemon=True).start()
     app.exec_()
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable
+from urllib.parse import urlparse
+
+from slack_sdk.web import WebClient
+
+from common import APP_DATA_DIR
+
+
+class EmojiIndex:
+    """An in-memory index of the workspace's custom emojis, from name to the path of the downloaded image.
+
+    The index is filled from `emoji.list` in one call, and only images that are new or have changed are downloaded,
+    in parallel. Looking a name up never touches the filesystem or the network, so it is safe while rendering.
+    """
+
+    def __init__(self, directory: str, max_workers: int = 8, timeout: float = 10):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "emojis.json")
+        self.timeout = timeout
+        self.max_workers = max_workers
+        # created with the first download, so importing `requests` doesn't slow startup down
+        self._session = None
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="emoji")
+        # name -> URL of the downloaded image, so a refresh only downloads what has changed
+        self._urls: dict[str, str] = {}
+        self._paths: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        # called with the changed names whenever emojis are added, changed or removed
+        self.listeners: list[Callable[[list[str]], None]] = []
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def load(self):
+        """Read the images downloaded by a previous session; only done once."""
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            try:
+                with open(self.manifest_path, "r") as f:
+                    manifest: dict[str, dict] = json.load(f)
+            except (OSError, ValueError):
+                manifest = {}
+            for name, entry in manifest.items():
+                if os.path.exists(entry["path"]):
+                    self._urls[name] = entry["url"]
+                    self._paths[name] = entry["path"]
+
+    def path(self, name: str) -> str | None:
+        return self._paths.get(name)
+
+    def paths(self, names: Iterable[str]) -> dict[str, str]:
+        """Return the paths of the emojis that have been downloaded; unknown names are left out."""
+        return {name: self._paths[name] for name in names if name in self._paths}
+
+    def sync(self, slack_client: WebClient) -> list[str]:
+        """Fetch the full custom emoji list, download the new or changed images and forget removed emojis.
+
+        Returns the names that changed.
+        """
+        self.load()
+        emojis: dict[str, str] = slack_client.emoji_list()["emoji"]
+        urls = {}
+        for name, value in emojis.items():
+            # aliases point at another emoji's name instead of an image
+            url = emojis.get(value[len("alias:"):], "") if value.startswith("alias:") else value
+            if url and not url.startswith("alias:"):
+                urls[name] = url
+        with self._lock:
+            removed = [name for name in self._urls if name not in urls]
+            stale = {name: url for name, url in urls.items() if self._urls.get(name) != url}
+        changed = self._remove(removed) + self._download_many(stale)
+        self._save()
+        self._notify(changed)
+        return changed
+
+    def apply_event(self, event: dict) -> list[str]:
+        """Merge an `emoji_changed` event into the index, downloading the added image if there is one."""
+        self.load()
+        subtype = event.get("subtype")
+        if subtype == "add":
+            value = event["value"]
+            if value.startswith("alias:"):
+                value = self._urls.get(value[len("alias:"):], "")
+            changed = self._download_many({event["name"]: value} if value else {})
+        elif subtype == "remove":
+            changed = self._remove(event.get("names", []))
+        elif subtype == "rename":
+            changed = self._remove([event["old_name"]]) + self._download_many({event["new_name"]: event["value"]})
+        else:
+            return []
+        self._save()
+        self._notify(changed)
+        return changed
+
+    def _remove(self, names: list[str]) -> list[str]:
+        removed = []
+        with self._lock:
+            for name in names:
+                self._urls.pop(name, None)
+                path = self._paths.pop(name, None)
+                if path is not None:
+                    removed.append(name)
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        return removed
+
+    def _download_many(self, urls: dict[str, str]) -> list[str]:
+        downloaded = []
+        for name, path in zip(urls, self._pool.map(self._download, urls.keys(), urls.values())):
+            if path is not None:
+                downloaded.append(name)
+        return downloaded
+
+    def _download(self, name: str, url: str) -> str | None:
+        import requests
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            print(f"Error downloading emoji {name}: {e}")
+            return None
+        extension = os.path.splitext(urlparse(url).path)[1] or ".png"
+        path = os.path.join(self.directory, name + extension)
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temporary file first, so a reader never sees a half-written image
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(response.content)
+        os.replace(temp_path, path)
+        with self._lock:
+            previous_path = self._paths.get(name)
+            self._urls[name] = url
+            self._paths[name] = path
+        if previous_path is not None and previous_path != path:
+            try:
+                os.remove(previous_path)
+            except OSError:
+                pass
+        return path
+
+    def _save(self):
+        with self._lock:
+            manifest = {name: {"url": self._urls[name], "path": path} for name, path in self._paths.items()}
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = f"{self.manifest_path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def _notify(self, changed: list[str]):
+        if not changed:
+            return
+        for listener in self.listeners:
+            listener(changed)
+
+
+emoji_index = EmojiIndex(os.path.join(APP_DATA_DIR, "emojis"))
@@ -1,120 +1,91 @@
-import threading
-from functools import partial
-from typing import List, Any
+from typing import List
 
 from qt_async_threads import QtAsyncRunner
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
-from messages.parse import parse_message
-from ui.widgets.messages_browser import MessagesBrowser
-from users.cache import get_cached_users, cache_profile_pictures
-from users.info import fetch_user_info, fetch_image
 
+from common import HISTORY_PAGE_SIZE
+from messages.render_cache import render_cache
+from messages.replies import replies_loader
+from messages.store import message_store
+from users.avatars import avatar_pixels, device_pixel_ratio
+from users.info import resolve_users
+from utils.tracing import traced
 
+# the most pages of new messages requested when catching up with a channel
+MAX_SYNC_PAGES = 5
+
+
+@traced("apply_additional_properties", "fetch")
 async def apply_additional_properties(slack_client: WebClient, channel_messages: List[dict], channel_id: str):
-    """Apply additional properties to messages, such as the user's profile picture, """
-    users_pending_cache = {}
+    """Apply additional properties to messages, such as the user's profile picture.
+
+    The distinct authors of the batch are resolved up front (cache first, then a bounded parallel fetch), so the
+    number of round trips scales with the number of authors rather than the number of messages. Thread replies
+    aren't fetched here; they're loaded when they're shown (see `fetch_replies`).
+    """
+    channel_messages = [message for message in channel_messages if "user" in message]
     length = len(channel_messages)
-    runner = QtAsyncRunner()
-    for i, message in enumerate(channel_messages):
-        tasks = []
-        if "user" not in message:
-            print("No user found in message")
-            channel_messages.remove(message)
-            continue
 
-        message["text"] = parse_message(message["text"])
-        message["channel"] = channel_id
+    # avatars are fetched at the size they're drawn at on this display, so they're neither blurry nor oversized
+    pixels = avatar_pixels(device_pixel_ratio())
+    user_ids = list(dict.fromkeys(message["user"] for message in channel_messages))
+    users = await resolve_users(slack_client, user_ids, pixels)
 
-        # If it is a  *parent* message with replies (message is a thread), fetch the replies
-        if "thread_ts" in message and message["thread_ts"] == message["ts"]:
-            print("Fetching replies for message", message["ts"])
-            replies = await runner.run(
-                slack_client.conversations_replies,
-                channel=message["channel"],
-                ts=message["ts"]
-            )
-            # apply the one needed additional property here
-            for reply in replies["messages"]:
-                reply["channel"] = message["channel"]
-            # apply additional properties to the replies
-            if "messages" in replies and len(replies["messages"]) > 0:
-                message["replies"] = await apply_additional_properties(slack_client, replies["messages"])
-
-        # create a text browser for the message
-        message_browser = MessagesBrowser(message["channel"], slack_client)
-        message["text_browser"] = message_browser
-
-        cached_users = get_cached_users()
-        if not cached_users:
-            cached_users = {}
+    texts = render_cache.render(channel_id, channel_messages)
+    for i, message in enumerate(channel_messages):
+        message["text"] = texts[i]
+        message["channel"] = channel_id
 
         message["is_last"] = i == length - 1
-
-        print("rendering and caching user", message["user"])
-        cached_user = cached_users.get(message["user"])
-        if cached_user:
-            print(f"User found in cache: (ID: {message["user"]})")
-            message["user"] = cached_user
-            print("User ftched", message)
-            # await Message.write(slack_client, text_browser.textCursor(), channel_messages)
-            continue
-        elif message["user"] not in users_pending_cache:
-            print("user and client", message["user"], slack_client)
-            tasks.append(partial(fetch_user_info, slack_client, message["user"]))
-        else:
-            # As the condition above was not met, the user is accessible in `users_pending_cache`
-            print("User is already being processed", message["user"])
-            message["user"] = users_pending_cache[message["user"]]
-            # if the file has already been downloaded, we can just use it
-            if isinstance(message["user"]["profile"]["image_48"], bytes) or isinstance(
-                    message["user"]["profile"]["image_48"], str):
-                # await Message.write(text_browser.textCursor(), channel_messages)
-                continue
-            else:
-                # small case where the file has not been downloaded yet
-                while message["user"]["lock"].locked():
-                    pass
-                # the file has been downloaded, we can use it now
-                # await Message.write(text_browser.textCursor(), channel_messages)
-                continue
-
-        resolutions: list[str] = ["48"]
-        async for user in runner.run_parallel(tasks):
-            user = await user
-            message["user"] = user
-
-            for res in resolutions:
-                image_tasks: list[partial | Any] = [partial(fetch_image, user["profile"][f"image_{res}"])]
-
-            images = []
-            async for image in runner.run_parallel(image_tasks):
-                images.append(await image)
-
-            for res, image in zip(resolutions, images):
-                message["user"]["profile"][f"image_{res}"] = image
-
-            users_pending_cache[message["user"]] = message["user"]
-            users_pending_cache[message["user"]]["lock"] = threading.Lock()
-        print("User ftched", message)
-
-        # await Message.write(text_browser.textCursor(), channel_messages)
-
-    # run this in a separate thread, because it's a blocking operation & is unnecessary to be awaited
-    if len(users_pending_cache) > 0:
-        io_thread = threading.Thread(target=cache_profile_pictures,
-                                     args=(users_pending_cache,))
-        io_thread.start()
+        message["user"] = users[message["user"]]
     return channel_messages
 
 
-async def fetch_messages(slack_client: WebClient, channel_id: str):
-    try:
-        response = slack_client.conversations_history(channel=channel_id, limit=10)
+def newest_ts(channel_messages: List[dict]) -> str | None:
+    return max((message["ts"] for message in channel_messages), key=float, default=None)
+
+
+@traced("sync_channel_history", "fetch")
+def sync_channel_history(slack_client: WebClient, channel_id: str, limit: int = HISTORY_PAGE_SIZE) -> List[dict]:
+    """Bring the stored history of a channel up to date, and return its newest `limit` messages (oldest first).
+
+    Only messages newer than the channel's sync mark are requested; messages stored from live events don't move it,
+    so a gap before them is filled here. If more than `MAX_SYNC_PAGES` pages have arrived since the last sync, the
+    stored history would have a gap, so it's replaced by the fresh messages.
+    """
+    oldest = message_store.synced_up_to(channel_id)
+    if oldest is None:
+        response = slack_client.conversations_history(channel=channel_id, limit=limit)
         channel_messages = response.get("messages")
-        # The newest message should be at the bottom, so reverse the list
-        channel_messages = list(reversed(channel_messages))
-        # TODO: compile the messages into one before rendering
+        # anything stored so far came from live events, and may be older than this page, past a gap
+        message_store.clear(channel_id)
+        message_store.upsert_many(channel_id, channel_messages, newest_ts(channel_messages))
+        return message_store.get_messages(channel_id, limit=limit)
+
+    new_messages = []
+    cursor = None
+    has_more = False
+    for _ in range(MAX_SYNC_PAGES):
+        response = slack_client.conversations_history(channel=channel_id, oldest=oldest, limit=200, cursor=cursor)
+        new_messages.extend(response.get("messages"))
+        cursor = (response.get("response_metadata") or {}).get("next_cursor")
+        has_more = bool(response.get("has_more")) and bool(cursor)
+        if not has_more:
+            break
+    if has_more:
+        message_store.clear(channel_id)
+    if new_messages:
+        message_store.upsert_many(channel_id, new_messages, newest_ts(new_messages))
+    return message_store.get_messages(channel_id, limit=limit)
+
+
+@traced("fetch_messages", "fetch")
+async def fetch_messages(slack_client: WebClient, channel_id: str, limit: int = HISTORY_PAGE_SIZE):
+    try:
+        runner = QtAsyncRunner()
+        # The store returns the newest message last, so it ends up at the bottom
+        channel_messages = await runner.run(sync_channel_history, slack_client, channel_id, limit)
         for message in channel_messages:
             # only apply one additional property here; it's required in that func
             message["channel"] = channel_id
@@ -126,16 +97,74 @@ async def fetch_messages(slack_client: WebClient, channel_id: str):
         return []
 
 
-async def fetch_replies(slack_client: WebClient, channel_id: str, thread_ts: str):
+async def fetch_stored_messages(slack_client: WebClient, channel_id: str, limit: int = HISTORY_PAGE_SIZE,
+                                since: str | None = None):
+    """Load the newest messages of a channel from the store only, e.g. after an event has been merged into it.
+
+    With `since`, every stored message from that `ts` on is loaded instead, however many there are.
+    """
+    runner = QtAsyncRunner()
+    if since is None:
+        channel_messages = await runner.run(message_store.get_messages, channel_id, limit)
+    else:
+        channel_messages = await runner.run(message_store.get_messages, channel_id, since=since)
+    return await apply_additional_properties(slack_client, channel_messages, channel_id)
+
+
+@traced("load_history_page", "fetch")
+def load_history_page(slack_client: WebClient, channel_id: str, before: str, cursor: str | None,
+                      limit: int) -> tuple[List[dict], str | None, bool]:
+    """Load the page of messages older than `before`, oldest first; from the store if it has them, else from the API.
+
+    Returns a tuple of `(messages, next_cursor, has_more)`.
+    """
+    # stored messages newer than the sync mark came from live events, and may have gaps between them
+    synced_ts = message_store.synced_up_to(channel_id)
+    if synced_ts is not None and float(before) <= float(synced_ts):
+        stored = message_store.get_messages(channel_id, limit=limit, before=before)
+        if stored:
+            return stored, cursor, True
+    if cursor:
+        response = slack_client.conversations_history(channel=channel_id, cursor=cursor, limit=limit)
+    else:
+        response = slack_client.conversations_history(channel=channel_id, latest=before, limit=limit)
+    channel_messages = response.get("messages")
+    message_store.upsert_many(channel_id, channel_messages)
+    next_cursor = (response.get("response_metadata") or {}).get("next_cursor") or None
+    return list(reversed(channel_messages)), next_cursor, bool(response.get("has_more"))
+
+
+async def fetch_older_messages(slack_client: WebClient, channel_id: str, before: str, cursor: str | None = None,
+                               limit: int = HISTORY_PAGE_SIZE) -> tuple[List[dict], str | None, str | None, bool]:
+    """Fetch the page of history preceding the message `before`.
+
+    Returns a tuple of `(messages, oldest_ts, next_cursor, has_more)`, where `oldest_ts` is the `before` of the next
+    page.
+    """
     try:
-        response = slack_client.conversations_replies(channel=channel_id, ts=thread_ts)
-        channel_messages = response.get("messages")
-        # The newest message should be at the bottom, so reverse the list
-        channel_messages = list(reversed(channel_messages))
+        runner = QtAsyncRunner()
+        channel_messages, next_cursor, has_more = await runner.run(
+            load_history_page, slack_client, channel_id, before, cursor, limit)
+        oldest_ts = channel_messages[0]["ts"] if channel_messages else None
         for message in channel_messages:
-            # only apply one additional property here; it's required in that func
             message["channel"] = channel_id
-        await apply_additional_properties(slack_client, channel_messages, channel_id)
+        channel_messages = await apply_additional_properties(slack_client, channel_messages, channel_id)
+        return channel_messages, oldest_ts, next_cursor, has_more and oldest_ts is not None
+    except SlackApiError as e:
+        print(e.response['error'])
+        return [], None, None, False
+
+
+@traced("fetch_replies", "fetch")
+async def fetch_replies(slack_client: WebClient, channel_id: str, thread_ts: str, latest_reply: str | None = None):
+    """Fetch the messages of a thread, reusing the replies prefetched by `replies_loader` if they're still current."""
+    try:
+        runner = QtAsyncRunner()
+        thread_messages = await runner.run(
+            replies_loader.load(slack_client, channel_id, thread_ts, latest_reply).result)
+        # the loaded messages are shared with later requests, so annotate copies of them
+        channel_messages = [dict(message, channel=channel_id) for message in thread_messages]
+        channel_messages = await apply_additional_properties(slack_client, channel_messages, channel_id)
     except SlackApiError as e:
         print(e.response['error'])
         return []
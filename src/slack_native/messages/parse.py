@@ -1,124 +1,137 @@
-import glob
-import os
 import re
-import time
 from typing import List
 from functools import lru_cache
-from typing import Any
-
-import emoji_data_python
-import requests
-
-# Slack formatting patterns
-bold_pattern = re.compile(r'\*(.*?)\*')
-italic_pattern = re.compile(r'_(.*?)_')
-strikethrough_pattern = re.compile(r'~(.*?)~')
-link_pattern = re.compile(r'<(https?://\S+)(\|.*?)?>')
-channel_pattern = re.compile(r'#(\w+)')
-emoji_pattern = re.compile(r':(\w+):')
-
-
-@lru_cache()
-def path_to_emoji(emoji_name: str):
-    pattern = f"tmp/{emoji_name}.*"
-    files = glob.glob(pattern)
-    if len(files) > 0:
-        return files[0]
-    return None
-
-
-@lru_cache
-def fetch_emojis(emoji_names: tuple[str, ...]) -> dict[str, str | Any] | None:
-    emoji_paths_to_fetch = []
-    for emoji_name in emoji_names:
-        emoji_path = path_to_emoji(emoji_name)
-        if emoji_path is None:
-            emoji_paths_to_fetch.append(emoji_name)
-    if len(emoji_paths_to_fetch) == 0:
-        return {emoji_name: path_to_emoji(emoji_name) for emoji_name in emoji_names}
-    # TODO: dynamically create the URL with the ID of the workspace
-    url = "https://edgeapi.slack.com/cache/T0266FRGM/emojis/info?fp=af&_x_num_retries=0"
-
-    headers = {
-        "accept": "*/*",
-        "accept-language": "en-GB,en-US;q=0.9,en;q=0.8",
-        "content-type": "text/plain;charset=UTF-8",
-        "priority": "u=1, i",
-        "sec-fetch-dest": "empty",
-        "sec-fetch-mode": "cors",
-        "sec-fetch-site": "same-site",
-        "cookie": "b=.7f6d3a7f91a49fa25deb1a7a75981bb8; shown_ssb_redirect_page=1; tz=600; "
-                  "ssb_instance_id=88782ac3-cf28-4bae-972f-37557833f9be; shown_download_ssb_modal=1; "
-                  "show_download_ssb_banner=1; no_download_ssb_banner=1; lc=1719302924; d-s=1720603559; "
-                  "d=xoxd-559HyoyjyEFcp501mtzwT0NiXC%2F6hUEMusQaYBXD"
-                  "%2Fv8JjATjratJD0Po2my0oDea2O2QEjfTXYDsEZAukAJRqxp3vVU8gWodPCHDNhe3bGbwqyqTYNkFkMgC7M8GBw%2By"
-                  "%2B4MBfFIyX7XCqkYqP1bB43iKPVpEixWz%2FSsFLrdtY1SP12heGvEwSSGYS1zS%2FDSWC6BQSmE%3D; "
-                  "OptanonConsent=isGpcEnabled=0&datestamp=Wed+Jul+10+2024+19%3A28%3A07+GMT%2B1000+("
-                  "Australian+Eastern+Standard+Time)&version=202402.1.0&browserGpcFlag=0&isIABGlobal=false&hosts"
-                  "=&consentId=be51caff-fb27-4b35-a38f-ad1e7e1b5dbc&interactionCount=1&isAnonUser=1&landingPath"
-                  "=NotLandingPage&groups=1%3A1%2C3%3A1%2C2%3A1%2C4%3A0&AwaitingReconsent=false; "
-                  "x=7f6d3a7f91a49fa25deb1a7a75981bb8.1720606589; "
-                  "web_cache_last_updated337a2a499a436d9ae22c2cffdca55138=1720606594597"
-    }
-
-    # TODO: replace sample token with a valid token
-    data = {
-        "token": "xoxc-2210535565-7290482160290-7327065577730"
-                 "-16df343f7eeb21cd1964d263c717c20f16a3279b3f5bf14143a7c5cd25d89b85",
-        "updated_ids": {path: 0 for path in emoji_paths_to_fetch}
-    }
-
-    response = requests.post(url, headers=headers, json=data)
-
-    result = response.json()["results"]
-    if len(result) > 0:
-        # download the files locally for caching & rendering
-        res = requests.get(result[0]["value"])
-        # if the folder does not exist, create it
-        if not os.path.exists("../tmp"):
-            os.makedirs("../tmp")
-
-        emoji_paths = {}
-
-        for i, emoji_name in enumerate(emoji_paths_to_fetch):
-            file_extension = result[i]["value"].split(".")[-1]
-            with open("tmp/" + emoji_name + "." + file_extension, "wb") as file:
-                file.write(res.content)
-                emoji_paths[emoji_name] = "tmp/" + emoji_name + "." + file_extension
-        return emoji_paths
-    else:
-        print("Error fetching emojis")
-        return None
 
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web import WebClient
+
+from messages.emojis import emoji_index
+from utils.tracing import traced
+
+# Slack formatting, as one pattern with an alternative per token, so the text is scanned once
+token_pattern = re.compile(r"""
+    # every token starts with one of these characters; checking for them first lets most positions fail fast
+    (?=[`<*_~:\#\n])
+    (?:
+    ```(?P<block>(?s:.*?))```
+    | `(?P<code>[^`\n]+)`
+    # links and mentions; Slack escapes a literal `<` or `>` in message text, so these are unambiguous
+    | <(?P<angle>[^<>\n]*)>
+    # as in Slack, bold/italic/strikethrough markers only count at word boundaries (so `snake_case_name` stays as is),
+    # the formatted text can't start or end with whitespace, and formatting doesn't span lines
+    | (?<!\w)(?P<marker>[*_~])(?P<inner>[^\s*_~](?:[^\n]*?[^\s])?)(?P=marker)(?!\w)
+    | :(?P<emoji>[a-zA-Z0-9_+\-]+):(?::skin-tone-(?P<tone>[2-6]):)?
+    # `&#39;` and the like are HTML entities, not channels
+    | (?<![\w&])\#(?P<channel>\w+)
+    | (?P<newline>\n)
+    )
+""", re.VERBOSE)
+# every token starts with one of these characters, so text without any of them is returned as is
+token_start_pattern = re.compile(r"[`<*_~:#\n]")
+formatting_tags = {"*": "b", "_": "i", "~": "del"}
+# custom emojis are marked with private use characters until they have been resolved
+CUSTOM_EMOJI_START = "\ue000"
+CUSTOM_EMOJI_END = "\ue001"
+custom_emoji_placeholder = re.compile(f"{CUSTOM_EMOJI_START}([^{CUSTOM_EMOJI_END}]*){CUSTOM_EMOJI_END}")
+
+
+@lru_cache(maxsize=4096)
+def _render_angle_token(body: str) -> str:
+    """Render the contents of a `<...>` token: a link, a user or channel mention, or a special mention."""
+    target, _, label = body.partition("|")
+    if target.startswith("@"):
+        return f'<span class="mention">@{label or target[1:]}</span>'
+    if target.startswith("#"):
+        return f'<span class="channel">#{label or target[1:]}</span>'
+    if target.startswith("!"):
+        return f'<span class="mention">{label or "@" + target[1:]}</span>'
+    return f'<a href="{target}">{label or target}</a>'
+
+
+@lru_cache(maxsize=4096)
+def _render_emoji(name: str, skin_tone: str | None) -> str | None:
+    """Return the character of a standard emoji, or None if it's a custom one."""
+    # imported on first use, as loading its emoji data takes a while
+    import emoji_data_python
+    base_emoji = emoji_data_python.emoji_short_names.get(name.replace("-", "_"))
+    if base_emoji is None:
+        return None
+    if skin_tone is not None:
+        tone = emoji_data_python.emoji_short_names.get(f"skin-tone-{skin_tone}")
+        with_tone = base_emoji.skin_variations.get(tone.unified) if tone is not None else None
+        if with_tone is not None:
+            return with_tone.char
+    return base_emoji.char
+
+
+class _TokenRenderer:
+    """Renders the tokens matched by `token_pattern`; custom emojis are collected, to be resolved all at once."""
+
+    def __init__(self):
+        self.custom_emojis: List[str] = []
+
+    def __call__(self, match: re.Match) -> str:
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "angle":
+            return _render_angle_token(value)
+        if kind == "inner":
+            tag = formatting_tags[match.group("marker")]
+            return f"<{tag}>{token_pattern.sub(self, value)}</{tag}>"
+        if kind == "emoji" or kind == "tone":
+            name = match.group("emoji")
+            rendered = _render_emoji(name, match.group("tone"))
+            if rendered is None:
+                self.custom_emojis.append(name)
+                return f"{CUSTOM_EMOJI_START}{name}{CUSTOM_EMOJI_END}"
+            return rendered
+        if kind == "newline":
+            return "<br>"
+        if kind == "code":
+            # code spans are copied verbatim, without looking for formatting inside them
+            return f"<code>{value}</code>"
+        if kind == "block":
+            return f"<pre>{value.strip(chr(10))}</pre>"
+        return f'<span class="channel">#{value}</span>'
+
+
+def parse_message(text: str) -> str:
+    """Render Slack mrkdwn to HTML in a single pass over the text.
+
+    Handles bold, italic, strikethrough, inline code, code blocks, links, mentions, channels and emojis. Text inside
+    code and links is left alone. Slack already escapes `&`, `<` and `>` in message text, so the rest of the text is
+    copied through as-is. Rendered messages are cached by `messages.render_cache`.
+    """
+    return render_message(text)[0]
+
+
+@traced("render_message", "parse")
+def render_message(text: str) -> tuple[str, bool]:
+    """Like `parse_message`, but also returns whether the text has custom emojis, whose rendering can change."""
+    if token_start_pattern.search(text) is None:
+        return text, False
+    renderer = _TokenRenderer()
+    html = token_pattern.sub(renderer, text)
 
-@lru_cache()
-def parse_message(text):
-    start = time.time()
-    # Replace bold text
-    text = bold_pattern.sub(r'<b>\1</b>', text)
-    # Replace italic text
-    text = italic_pattern.sub(r'<i>\1</i>', text)
-    # Replace strikethrough text
-    text = strikethrough_pattern.sub(r'<del>\1</del>', text)
-    # Replace links
-    text = link_pattern.sub(r'<a href="\1">\2</a>', text)
-    # Replace channels
-    text = channel_pattern.sub(r'<span class="channel">#\1</span>', text)
-    # render standard emojis
-    text = emoji_data_python.replace_colons(text, False)
     # render custom emojis
-    shorthands: List[str] = emoji_pattern.findall(text)
-    shorthands_tuple = tuple(shorthands)
-    # type: ignore
-    emoji_urls = fetch_emojis(shorthands_tuple)
-    if emoji_urls is None:
-        return text
-
-    def replace_emoji(match):
-        return f'<img src="{emoji_urls.get(match.group(1))}" alt="{match.group(1)}" width="20" height="20">'
-
-    text = re.sub(emoji_pattern,
-                  replace_emoji, text)
-    end = time.time()
-    print(f"Rendering took {end - start} seconds")
-    return text
+    if renderer.custom_emojis:
+        # only emojis that have already been downloaded are shown; the rest stay as text until the next sync
+        emoji_paths = emoji_index.paths(dict.fromkeys(renderer.custom_emojis))
+
+        def replace_emoji(match):
+            name = match.group(1)
+            if name in emoji_paths:
+                return f'<img src="{emoji_paths[name]}" alt="{name}" width="20" height="20">'
+            return f":{name}:"
+
+        html = custom_emoji_placeholder.sub(replace_emoji, html)
+    return html, bool(renderer.custom_emojis)
+
+
+def sync_emojis(slack_client: WebClient):
+    """Bring the custom emoji index up to date; blocking, so run it off the UI thread."""
+    emoji_index.load()
+    try:
+        emoji_index.sync(slack_client)
+    except SlackApiError as e:
+        print(f"Error syncing emojis: {e}")
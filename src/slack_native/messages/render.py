@@ -1,17 +1,22 @@
 from typing import List
 
-from PySide6.QtWidgets import QScrollArea
+from ui.widgets.messages_view import MessagesView
+from utils.tracing import traced
 
-from ui.widgets.message import Message
 
-
-async def render_messages(scroll_area: QScrollArea, channel_messages: List[dict]) -> None:
-    """Given a list of messages, a Slack API Client, an array of messages` text browsers, render each message in their respective text browser.
-     This is different from the `write` method in the `Message` class, as it also fetches user
-    information and profile pictures.
+@traced("render_messages", "render")
+async def render_messages(view: MessagesView, channel_messages: List[dict], replace: bool = False) -> None:
+    """Given a list of messages, show them in the view.
+    Only the messages that are new, edited or deleted compared to what the view already shows cause any work, unless
+    `replace` is set, in which case the view only shows the given messages.
     """
-    # clear the scroll area
-    for i in reversed(range(scroll_area.widget().layout().count())):
-        scroll_area.widget().layout().itemAt(i).widget().deleteLater()
-    for message in channel_messages:
-        await Message.write(scroll_area, message=message)
+    if replace:
+        view.model().set_messages(channel_messages)
+    else:
+        view.model().apply_messages(channel_messages)
+
+
+@traced("prepend_messages", "render")
+async def prepend_messages(view: MessagesView, channel_messages: List[dict]) -> None:
+    """Insert older messages above the ones already shown in the view."""
+    view.model().insert_messages(channel_messages)
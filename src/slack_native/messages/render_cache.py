@@ -0,0 +1,180 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+from common import APP_DATA_DIR
+from messages.emojis import emoji_index
+from messages.parse import render_message
+from utils.sqlite_store import SQLiteStore
+from utils.tracing import tracer
+
+# bumped whenever `parse_message`'s output changes, so HTML rendered by an older version is thrown away
+RENDER_VERSION = 1
+# rendered HTML kept in memory, in characters
+MAX_MEMORY_CHARS = 8_000_000
+# rendered messages kept on disk; the least recently used are removed past this
+MAX_STORED_MESSAGES = 100_000
+
+
+def render_key(channel_id: str, message: dict) -> tuple[str, str, str]:
+    """Identify a message's text; an edit changes `edited.ts`, so the old rendering is never used for it."""
+    return channel_id, message["ts"], (message.get("edited") or {}).get("ts") or ""
+
+
+class RenderCache(SQLiteStore):
+    """A bounded cache of rendered message HTML, keyed by `(channel, ts, edited.ts)`, kept in memory and on disk.
+
+    Messages rendered in a previous session are read back from disk in one query per batch, so reopening a channel
+    doesn't parse anything. Messages with custom emojis are rendered again when the emojis change.
+    """
+    schema = (
+        "CREATE TABLE IF NOT EXISTS rendered ("
+        "channel TEXT NOT NULL, ts TEXT NOT NULL, edited TEXT NOT NULL, html TEXT NOT NULL, "
+        "custom_emojis INTEGER NOT NULL, used INTEGER NOT NULL, PRIMARY KEY (channel, ts, edited))",
+        "CREATE INDEX IF NOT EXISTS rendered_used ON rendered (used)",
+    )
+
+    def __init__(self, path: str, max_memory_chars: int = MAX_MEMORY_CHARS, max_stored: int = MAX_STORED_MESSAGES):
+        super().__init__(path)
+        self.max_memory_chars = max_memory_chars
+        self.max_stored = max_stored
+        # key -> (html, whether it has custom emojis)
+        self._memory: OrderedDict[tuple, tuple[str, bool]] = OrderedDict()
+        self._memory_chars = 0
+        self._lock = threading.Lock()
+        # bumped by `forget_custom_emojis`; HTML rendered (or read) before a bump isn't written back
+        self._epoch = 0
+        # orders the stored messages by their last use, across sessions
+        self._clock = itertools.count()
+        self._stored = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def on_initialized(self):
+        """Throw away HTML rendered by another version of the parser."""
+        connection = self.connection()
+        if connection.execute("PRAGMA user_version").fetchone()[0] != RENDER_VERSION:
+            with self.write_lock, connection:
+                connection.execute("DELETE FROM rendered")
+            connection.execute(f"PRAGMA user_version = {RENDER_VERSION}")
+        used, self._stored = connection.execute("SELECT COALESCE(MAX(used), 0), COUNT(*) FROM rendered").fetchone()
+        self._clock = itertools.count(used + 1)
+
+    def _remember(self, key: tuple, entry: tuple[str, bool]):
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_chars -= len(previous[0])
+        self._memory[key] = entry
+        self._memory_chars += len(entry[0])
+        while self._memory_chars > self.max_memory_chars and len(self._memory) > 1:
+            _, (html, _) = self._memory.popitem(last=False)
+            self._memory_chars -= len(html)
+
+    def render(self, channel_id: str, channel_messages: list[dict]) -> list[str]:
+        """Return the HTML of each message's text: from memory, then from disk, and only then by parsing it."""
+        with tracer.span("render_cache", "cache", channel=channel_id, messages=len(channel_messages)):
+            return self._render(channel_id, channel_messages)
+
+    def _render(self, channel_id: str, channel_messages: list[dict]) -> list[str]:
+        keys = [render_key(channel_id, message) for message in channel_messages]
+        found: dict[tuple, tuple[str, bool]] = {}
+        with self._lock:
+            epoch = self._epoch
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = entry
+            self.memory_hits += len(found)
+        on_disk = [key for key in dict.fromkeys(keys) if key not in found]
+        if on_disk:
+            stored = self._load(channel_id, on_disk)
+            found.update(stored)
+        rendered = {}
+        for key, message in zip(keys, channel_messages):
+            if key not in found:
+                found[key] = rendered[key] = render_message(message["text"])
+        with self._lock:
+            if on_disk:
+                self.disk_hits += len(on_disk) - len(rendered)
+                self.misses += len(rendered)
+                # the emojis changed while rendering, so this may have been made with the old ones
+                if epoch == self._epoch:
+                    for key in on_disk:
+                        self._remember(key, found[key])
+        self._store([key for key in on_disk if key not in rendered], rendered, epoch)
+        return [found[key][0] for key in keys]
+
+    def _load(self, channel_id: str, keys: list[tuple]) -> dict[tuple, tuple[str, bool]]:
+        wanted = set(keys)
+        stored = {}
+        # SQLite limits the number of host parameters per statement, so look the messages up in chunks
+        for i in range(0, len(keys), 500):
+            chunk = [key[1] for key in keys[i:i + 500]]
+            rows = self.connection().execute(
+                f"SELECT ts, edited, html, custom_emojis FROM rendered "
+                f"WHERE channel = ? AND ts IN ({','.join('?' * len(chunk))})", [channel_id, *chunk]).fetchall()
+            for ts, edited, html, custom_emojis in rows:
+                key = (channel_id, ts, edited)
+                if key in wanted:
+                    stored[key] = (html, bool(custom_emojis))
+        return stored
+
+    def _store(self, used: Iterable[tuple], rendered: dict[tuple, tuple[str, bool]], epoch: int):
+        """Write newly rendered messages, and mark the ones read from disk as used, in one transaction.
+
+        Messages rendered before the emojis changed (`epoch` is older) aren't written; `forget_custom_emojis` takes
+        the write lock after bumping the epoch, so anything written before that is deleted by it.
+        """
+        if not used and not rendered:
+            return
+        connection = self.connection()
+        with self.write_lock, connection:
+            if rendered and epoch == self._epoch:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO rendered (channel, ts, edited, html, custom_emojis, used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(*key, html, int(custom_emojis), next(self._clock))
+                     for key, (html, custom_emojis) in rendered.items()])
+                self._stored += len(rendered)
+            connection.executemany("UPDATE rendered SET used = ? WHERE channel = ? AND ts = ? AND edited = ?",
+                                   [(next(self._clock), *key) for key in used])
+            # prune in batches, rather than on every write
+            if self._stored > self.max_stored * 1.1:
+                connection.execute(
+                    "DELETE FROM rendered WHERE used <= (SELECT used FROM rendered ORDER BY used DESC LIMIT 1 OFFSET ?)",
+                    (self.max_stored,))
+                self._stored = connection.execute("SELECT COUNT(*) FROM rendered").fetchone()[0]
+
+    def forget_custom_emojis(self):
+        """Drop the messages with custom emojis, so they're rendered with the current emojis next time."""
+        with self._lock:
+            self._epoch += 1
+            for key in [key for key, (_, custom_emojis) in self._memory.items() if custom_emojis]:
+                self._memory_chars -= len(self._memory.pop(key)[0])
+        connection = self.connection()
+        with self.write_lock, connection:
+            connection.execute("DELETE FROM rendered WHERE custom_emojis = 1")
+            self._stored = connection.execute("SELECT COUNT(*) FROM rendered").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                # Python strings take one to four bytes per character; this counts characters
+                "memory_chars": self._memory_chars,
+                "stored": self._stored,
+            }
+
+
+render_cache = RenderCache(os.path.join(APP_DATA_DIR, "rendered.db"))
+# messages rendered before an emoji was downloaded (or after it was removed) have to be rendered again
+emoji_index.listeners.append(lambda _names: render_cache.forget_custom_emojis())
@@ -0,0 +1,48 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+from slack_sdk import WebClient
+
+from scheduler import background
+from utils.single_flight import SingleFlight
+
+# the most threads whose replies are kept in memory
+MAX_CACHED_THREADS = 256
+# how long loaded replies are reused; a new reply changes the parent's `latest_reply`, so they're loaded again anyway
+REPLIES_TTL = 300
+
+
+class RepliesLoader:
+    """Loads the raw replies of threads in the background, so they're usually ready by the time they're shown.
+
+    Replies are keyed by the parent's `latest_reply` too, so a thread is requested again once a newer reply has been
+    posted. Requests for a thread that is already being loaded share the same request.
+    """
+
+    def __init__(self, max_workers: int = 4, max_cached_threads: int = MAX_CACHED_THREADS):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="replies")
+        self._flight = SingleFlight(ttl=REPLIES_TTL, max_entries=max_cached_threads)
+
+    def load(self, slack_client: WebClient, channel_id: str, thread_ts: str, latest_reply: str | None = None) -> Future:
+        """Return a future resolving to all the messages of a thread (parent first), oldest first."""
+        return self._flight.submit((channel_id, thread_ts, latest_reply), self._pool,
+                                   self._fetch_thread, slack_client, channel_id, thread_ts)
+
+    def prefetch(self, slack_client: WebClient, message: dict):
+        """Start loading the replies of a thread parent, unless they're already loaded."""
+        if message.get("reply_count"):
+            self.load(background(slack_client), message["channel"], message["ts"], message.get("latest_reply"))
+
+    @staticmethod
+    def _fetch_thread(slack_client: WebClient, channel_id: str, thread_ts: str) -> List[dict]:
+        channel_messages = []
+        cursor = None
+        while True:
+            response = slack_client.conversations_replies(channel=channel_id, ts=thread_ts, cursor=cursor)
+            channel_messages.extend(response.get("messages"))
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not (response.get("has_more") and cursor):
+                return channel_messages
+
+
+replies_loader = RepliesLoader()
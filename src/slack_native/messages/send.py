@@ -9,7 +9,6 @@ def send_message(slack_client: WebClient, channel_id: str, message: str):
         Exception("Cannot send messages in dev mode")
     try:
         response = slack_client.chat_postMessage(channel=channel_id, text=message)
-        print(response)
         return response
     except SlackApiError as e:
         print(e.response['error'])
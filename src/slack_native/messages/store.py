@@ -0,0 +1,131 @@
+import json
+import os
+
+from common import APP_DATA_DIR
+from utils.sqlite_store import SQLiteStore
+
+
+class MessageStore(SQLiteStore):
+    """An on-disk store of raw channel messages, keyed by `(channel, ts)`.
+
+    Messages are stored exactly as returned by the Slack API (before `apply_additional_properties`), so they can be
+    re-annotated whenever they are loaded.
+
+    Each channel's history is complete from its oldest stored message up to its sync mark, the newest `ts` fetched
+    from the API. Live events may store newer messages, past a gap the next sync fills, so they never move the mark.
+    """
+    schema = (
+        "CREATE TABLE IF NOT EXISTS messages ("
+        "channel TEXT NOT NULL, ts TEXT NOT NULL, ts_order REAL NOT NULL, data TEXT NOT NULL, "
+        "PRIMARY KEY (channel, ts))",
+        "CREATE INDEX IF NOT EXISTS messages_order ON messages (channel, ts_order)",
+        "CREATE TABLE IF NOT EXISTS sync_marks (channel TEXT PRIMARY KEY, synced_ts TEXT NOT NULL)",
+    )
+
+    def get_messages(self, channel_id: str, limit: int | None = None, before: str | None = None,
+                     since: str | None = None) -> list[dict]:
+        """Return the newest `limit` stored messages of a channel, oldest first.
+
+        Only messages older than `before`, and from `since` on (inclusive), are returned, if given.
+        """
+        query = "SELECT data FROM messages WHERE channel = ?"
+        params: list = [channel_id]
+        if before is not None:
+            query += " AND ts_order < ?"
+            params.append(float(before))
+        if since is not None:
+            query += " AND ts_order >= ?"
+            params.append(float(since))
+        query += " ORDER BY ts_order DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        rows = self.connection().execute(query, params).fetchall()
+        return [json.loads(data) for data, in reversed(rows)]
+
+    def synced_up_to(self, channel_id: str) -> str | None:
+        """Return the `ts` up to which a channel's history has been fetched from the API; None if it never was."""
+        row = self.connection().execute("SELECT synced_ts FROM sync_marks WHERE channel = ?", (channel_id,)).fetchone()
+        return row[0] if row else None
+
+    def upsert_many(self, channel_id: str, channel_messages: list[dict], synced_ts: str | None = None):
+        """Store messages fetched from the API; `synced_ts` moves the channel's sync mark, if it's newer."""
+        rows = [(channel_id, message["ts"], float(message["ts"]), json.dumps(message))
+                for message in channel_messages]
+        connection = self.connection()
+        with self.write_lock, connection:
+            connection.executemany(
+                "INSERT INTO messages (channel, ts, ts_order, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(channel, ts) DO UPDATE SET data = excluded.data", rows)
+            if synced_ts is not None:
+                connection.execute(
+                    "INSERT INTO sync_marks (channel, synced_ts) VALUES (?, ?) ON CONFLICT(channel) DO UPDATE SET "
+                    "synced_ts = excluded.synced_ts WHERE CAST(excluded.synced_ts AS REAL) > CAST(synced_ts AS REAL)",
+                    (channel_id, synced_ts))
+
+    def delete(self, channel_id: str, ts: str):
+        connection = self.connection()
+        with self.write_lock, connection:
+            connection.execute("DELETE FROM messages WHERE channel = ? AND ts = ?", (channel_id, ts))
+
+    def clear(self, channel_id: str):
+        connection = self.connection()
+        with self.write_lock, connection:
+            connection.execute("DELETE FROM messages WHERE channel = ?", (channel_id,))
+            connection.execute("DELETE FROM sync_marks WHERE channel = ?", (channel_id,))
+
+    def apply_event(self, event: dict):
+        """Merge a `message` event (new message, edit or deletion) into the store."""
+        self.apply_events([event])
+
+    def apply_events(self, events: list[dict]):
+        """Merge a batch of `message` events into the store, in a single transaction."""
+        connection = self.connection()
+        with self.write_lock, connection:
+            for event in events:
+                channel_id = event["channel"]
+                subtype = event.get("subtype")
+                if subtype == "message_deleted":
+                    connection.execute("DELETE FROM messages WHERE channel = ? AND ts = ?",
+                                       (channel_id, event["deleted_ts"]))
+                elif subtype == "message_changed":
+                    # only edits of messages we already have are merged; anything else is picked up by the next sync
+                    message = event["message"]
+                    connection.execute("UPDATE messages SET data = ? WHERE channel = ? AND ts = ?",
+                                       (json.dumps(message), channel_id, message["ts"]))
+                elif subtype == "message_replied":
+                    # carries the thread's parent, with its updated reply count
+                    message = event["message"]
+                    connection.execute("UPDATE messages SET data = ? WHERE channel = ? AND ts = ?",
+                                       (json.dumps(message), channel_id, message["ts"]))
+                elif event.get("hidden") or "ts" not in event:
+                    continue
+                elif event.get("thread_ts", event["ts"]) != event["ts"] and subtype != "thread_broadcast":
+                    # replies aren't channel messages; only their parent's reply count changes
+                    self._count_reply(connection, channel_id, event["thread_ts"], event["ts"])
+                else:
+                    message = {key: value for key, value in event.items()
+                               if key not in ("channel", "event_ts", "channel_type")}
+                    connection.execute(
+                        "INSERT INTO messages (channel, ts, ts_order, data) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(channel, ts) DO UPDATE SET data = excluded.data",
+                        (channel_id, message["ts"], float(message["ts"]), json.dumps(message)))
+                    if subtype == "thread_broadcast":
+                        self._count_reply(connection, channel_id, event["thread_ts"], event["ts"])
+
+    @staticmethod
+    def _count_reply(connection, channel_id: str, thread_ts: str, reply_ts: str):
+        row = connection.execute("SELECT data FROM messages WHERE channel = ? AND ts = ?",
+                                 (channel_id, thread_ts)).fetchone()
+        if row is None:
+            return
+        parent = json.loads(row[0])
+        # a reply that isn't newer than the latest one is already counted (e.g. by a `message_replied` event)
+        if float(reply_ts) <= float(parent.get("latest_reply") or 0):
+            return
+        parent.update(thread_ts=thread_ts, reply_count=parent.get("reply_count", 0) + 1, latest_reply=reply_ts)
+        connection.execute("UPDATE messages SET data = ? WHERE channel = ? AND ts = ?",
+                           (json.dumps(parent), channel_id, thread_ts))
+
+
+message_store = MessageStore(os.path.join(APP_DATA_DIR, "messages.db"))
@@ -0,0 +1,161 @@
+import atexit
+import json
+import os
+import time
+from typing import List
+
+from PySide6.QtCore import QTimer
+from qt_async_threads import QtAsyncRunner
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from common import APP_DATA_DIR
+from messages.fetch import sync_channel_history
+from scheduler import BudgetedClient, BudgetExhausted, background
+from users.cache import get_cached_users, cache_users
+from users.info import fetch_user_info, has_profile_urls
+
+# how many channels are warmed after the UI goes idle
+WARM_CHANNELS = 5
+# what one warming pass may spend, so it stays small next to what the user is doing
+WARM_MAX_REQUESTS = 30
+WARM_MAX_BYTES = 2_000_000
+# how long the UI has to be left alone before warming starts
+IDLE_DELAY_MS = 3000
+# a switch to a channel counts half as much after this many seconds
+SWITCH_HALF_LIFE = 7 * 24 * 60 * 60
+# how long recorded switches wait before they're written out, so switching quickly writes the file once
+SAVE_DELAY_MS = 2000
+
+
+def warm_channel(slack_client: WebClient, channel_id: str):
+    """Bring a channel's stored history up to date and cache its authors; meant to be run in a worker thread.
+
+    Avatars aren't downloaded, as they don't go through the client (and so its budget); they're fetched on their own
+    when the channel is opened.
+    """
+    channel_messages = sync_channel_history(slack_client, channel_id)
+    user_ids = list(dict.fromkeys(message["user"] for message in channel_messages if "user" in message))
+    cached = get_cached_users(user_ids)
+    fetched = {user_id: fetch_user_info(slack_client, user_id) for user_id in user_ids
+               if user_id not in cached or not has_profile_urls(cached[user_id])}
+    cache_users(fetched)
+
+
+class ChannelWarmer:
+    """Preloads the history and authors of the channels the user is likely to open next, once the UI is idle.
+
+    Channels are ranked by how often (and how recently) the user has switched to them, then by their latest activity.
+    Warming goes through the background priority of the API scheduler and stops when its budget is spent, and it
+    waits while a channel is being loaded in the foreground.
+    """
+
+    def __init__(self, slack_client: WebClient, channels: List[dict], top_n: int = WARM_CHANNELS,
+                 max_requests: int = WARM_MAX_REQUESTS, max_bytes: int = WARM_MAX_BYTES,
+                 idle_delay: int = IDLE_DELAY_MS, save_delay: int = SAVE_DELAY_MS):
+        self.slack_client = slack_client
+        self.channels = channels
+        self.top_n = top_n
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.history_path = os.path.join(APP_DATA_DIR, "channel_switches.json")
+        # channel -> {"count": number of switches, "last": time of the last one}
+        self.switches: dict[str, dict] = self._load_switches()
+        self._unsaved = False
+        self._save_timer = QTimer()
+        self._save_timer.setSingleShot(True)
+        self._save_timer.setInterval(save_delay)
+        self._save_timer.timeout.connect(self.flush)
+        # switches recorded just before quitting are written out too
+        atexit.register(self.flush)
+        self.warmed: set[str] = set()
+        # number of foreground channel loads in progress; warming waits for them
+        self.foreground = 0
+        self.selected_channel: str | None = None
+        self.runner = QtAsyncRunner()
+        self._warming = False
+        self._timer = QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(idle_delay)
+        self._timer.timeout.connect(lambda: self.runner.start_coroutine(self.warm()))
+
+    def _load_switches(self) -> dict[str, dict]:
+        try:
+            with open(self.history_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_switches(self):
+        os.makedirs(APP_DATA_DIR, exist_ok=True)
+        with open(self.history_path, "w") as f:
+            json.dump(self.switches, f)
+
+    def flush(self):
+        """Write the recorded switches out now, if any haven't been yet."""
+        if not self._unsaved:
+            return
+        self._unsaved = False
+        try:
+            self._save_switches()
+        except OSError as e:
+            print(f"Error saving channel switches: {e}")
+
+    def record_switch(self, channel_id: str):
+        """Count a switch to a channel, and wait for the UI to be idle again before warming."""
+        switch = self.switches.setdefault(channel_id, {"count": 0, "last": 0})
+        switch["count"] += 1
+        switch["last"] = time.time()
+        self._unsaved = True
+        # not restarted by later switches, so the file is written at most `save_delay` after a switch
+        if not self._save_timer.isActive():
+            self._save_timer.start()
+        self.selected_channel = channel_id
+        # a channel that has been opened is loaded by the channel itself from now on
+        self.warmed.add(channel_id)
+        self.start_when_idle()
+
+    def start_when_idle(self):
+        self._timer.start()
+
+    def score(self, channel: dict, now: float) -> tuple[float, float]:
+        switch = self.switches.get(channel["id"])
+        switch_score = 0.0
+        if switch is not None:
+            switch_score = switch["count"] * 0.5 ** ((now - switch["last"]) / SWITCH_HALF_LIFE)
+        # `updated` is the channel's latest activity, in milliseconds
+        return switch_score, float(channel.get("updated") or 0)
+
+    def rank(self) -> List[dict]:
+        """The channels worth warming, most likely to be opened next first."""
+        now = time.time()
+        candidates = [channel for channel in self.channels
+                      if channel["id"] not in self.warmed and channel["id"] != self.selected_channel]
+        candidates.sort(key=lambda channel: self.score(channel, now), reverse=True)
+        return candidates[:self.top_n]
+
+    async def warm(self):
+        if self._warming:
+            return
+        if self.foreground:
+            self.start_when_idle()
+            return
+        self._warming = True
+        budget = BudgetedClient(background(self.slack_client), self.max_requests, self.max_bytes)
+        try:
+            for channel in self.rank():
+                if self.foreground:
+                    # the user is waiting on a channel; carry on once they're idle again
+                    self.start_when_idle()
+                    return
+                try:
+                    await self.runner.run(warm_channel, budget, channel["id"])
+                except BudgetExhausted:
+                    return
+                except SlackApiError as e:
+                    print(f"Error warming channel {channel['id']}: {e.response['error']}")
+                self.warmed.add(channel["id"])
+                if budget.exhausted():
+                    return
+        finally:
+            self._warming = False
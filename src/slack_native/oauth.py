@@ -8,10 +8,10 @@ import time
 import hashlib
 import hmac
 from signals import MessagesUpdatedSignal
+from events import handle_event
 import keyring
 
 load_dotenv(".env")
-messages = []
 app = Flask(__name__)
 secret_key = os.environ.get("FLASK_SECRET_KEY")
 
@@ -41,9 +41,8 @@ class This:
 this = This()
 
 
-def main(messages_manager: MessagesUpdatedSignal, window):
+def main(messages_manager: MessagesUpdatedSignal):
     this.messages_manager = messages_manager
-    this.show_window_signal = window
     app.run(debug=True, use_reloader=False, port=5000)
 
 
@@ -107,24 +106,6 @@ def listen():
     if "challenge" in request_json:
         return handle_challenge(request)
     elif "event" in request_json:
-        event = request_json["event"]
-        if event["type"] == "message":
-            # new message received, update the UI
-            messages[event["channel"]].append(event["text"])
-            print(messages)
-            this.messages_manager.messages_updated_signal.emit(event["channel"], messages[event["channel"]])
+        handle_event(request_json["event"], this.messages_manager)
 
     return "Request received."
-
-
-@app.route("/ipc", methods=["POST"])
-def ipc():
-    body = request.json
-    action: dict = body.get("action")
-    if not action:
-        return "No action specified", 400
-    if action.get("window"):
-        action = action.get("window")
-        if action == "show":
-            this.show_window_signal.show_window.emit()
-    return "IPC endpoint"
@@ -0,0 +1,265 @@
+import heapq
+import itertools
+import json
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Callable
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from utils.tracing import tracer
+
+# work for what the user is looking at goes first; prefetching waits until nothing else needs the method's budget
+PRIORITY_VISIBLE = 0
+PRIORITY_BACKGROUND = 1
+
+# Slack's rate limit tiers, as (requests per minute, burst)
+TIER_1 = (1, 1)
+TIER_2 = (20, 5)
+TIER_3 = (50, 10)
+TIER_4 = (100, 20)
+METHOD_TIERS = {
+    "apps_connections_open": TIER_1,
+    "users_list": TIER_2,
+    "emoji_list": TIER_2,
+    "conversations_history": TIER_3,
+    "conversations_replies": TIER_3,
+    "users_conversations": TIER_3,
+    "users_info": TIER_4,
+    # chat.postMessage is "special": about one message per second
+    "chat_postMessage": (60, 3),
+}
+# methods that aren't listed are assumed to be tier 3
+DEFAULT_TIER = TIER_3
+# how often a rate limited (429) request is retried after waiting for `Retry-After`
+MAX_RETRIES = 3
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        # set from a 429's `Retry-After`; no requests are made before then
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a request may be made; 0 if one may be made now."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class MethodStats:
+    def __init__(self, maxlen: int = 1000):
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.latencies: deque[float] = deque(maxlen=maxlen)
+        self.queue_waits: deque[float] = deque(maxlen=maxlen)
+
+    @staticmethod
+    def _summary(values) -> dict:
+        values = sorted(values)
+        if not values:
+            return {}
+        return {
+            "mean": statistics.fmean(values),
+            "p50": values[len(values) // 2],
+            "p95": values[min(len(values) - 1, int(len(values) * 0.95))],
+            "max": values[-1],
+        }
+
+    def summary(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "latency": self._summary(list(self.latencies)),
+            "queue_wait": self._summary(list(self.queue_waits)),
+        }
+
+
+class ApiScheduler:
+    """Schedules every Slack Web API call made through it, per method.
+
+    Each method has a token bucket matching its rate limit tier; a call blocks its thread until the bucket has a
+    token, and waiting calls are let through by priority, then in order. A 429 response blocks the method for its
+    `Retry-After` and the call is queued again. As that can take seconds, calls must be made off the UI thread (with
+    `runner.run`).
+
+    The client can be given as a factory instead, which is called on the first API call.
+    """
+
+    def __init__(self, client: WebClient | None = None, max_retries: int = MAX_RETRIES,
+                 client_factory: Callable[[], WebClient] | None = None):
+        self._client = client
+        self._client_factory = client_factory
+        self._client_lock = threading.Lock()
+        self.max_retries = max_retries
+        self._condition = threading.Condition()
+        self._buckets: dict[str, TokenBucket] = {}
+        # method -> heap of (priority, sequence) of the calls waiting for a token
+        self._waiting: dict[str, list[tuple[int, int]]] = {}
+        self._sequence = itertools.count()
+        self._stats: dict[str, MethodStats] = {}
+
+    @property
+    def client(self) -> WebClient:
+        with self._client_lock:
+            if self._client is None:
+                self._client = self._client_factory()
+            return self._client
+
+    def _bucket(self, method: str) -> TokenBucket:
+        bucket = self._buckets.get(method)
+        if bucket is None:
+            bucket = self._buckets[method] = TokenBucket(*METHOD_TIERS.get(method, DEFAULT_TIER))
+            self._waiting[method] = []
+            self._stats[method] = MethodStats()
+        return bucket
+
+    def _acquire(self, method: str, priority: int) -> float:
+        """Wait for the method's turn; returns the time spent waiting."""
+        start = time.monotonic()
+        with self._condition:
+            bucket = self._bucket(method)
+            waiting = self._waiting[method]
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(waiting, ticket)
+            while True:
+                now = time.monotonic()
+                wait_time = bucket.wait_time(now)
+                if waiting[0] == ticket and wait_time == 0:
+                    heapq.heappop(waiting)
+                    bucket.take()
+                    # the next waiter may be able to go too
+                    self._condition.notify_all()
+                    return now - start
+                self._condition.wait(timeout=wait_time or None)
+
+    def _back_off(self, method: str, retry_after: float):
+        with self._condition:
+            bucket = self._bucket(method)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+            self._stats[method].rate_limited += 1
+            self._condition.notify_all()
+
+    def call(self, method: str, priority: int = PRIORITY_VISIBLE, **kwargs):
+        for attempt in range(self.max_retries + 1):
+            queue_wait = self._acquire(method, priority)
+            start = time.perf_counter()
+            try:
+                with tracer.span(method, "fetch", priority=priority, attempt=attempt, queue_wait=queue_wait):
+                    response = getattr(self.client, method)(**kwargs)
+            except SlackApiError as e:
+                latency = time.perf_counter() - start
+                with self._condition:
+                    stats = self._stats[method]
+                    stats.latencies.append(latency)
+                    stats.queue_waits.append(queue_wait)
+                if e.response is not None and e.response.status_code == 429 and attempt < self.max_retries:
+                    self._back_off(method, float(e.response.headers.get("Retry-After", 1)))
+                    continue
+                with self._condition:
+                    self._stats[method].errors += 1
+                raise
+            latency = time.perf_counter() - start
+            with self._condition:
+                stats = self._stats[method]
+                stats.calls += 1
+                stats.latencies.append(latency)
+                stats.queue_waits.append(queue_wait)
+            return response
+
+    def stats(self) -> dict[str, dict]:
+        """Per-method call counts, errors, 429s, latency and queue wait (in seconds)."""
+        with self._condition:
+            return {method: stats.summary() for method, stats in self._stats.items()}
+
+
+class ScheduledClient:
+    """A `WebClient` look-alike whose API methods go through an `ApiScheduler` at a given priority."""
+
+    def __init__(self, client: WebClient | None = None, scheduler: ApiScheduler | None = None,
+                 priority: int = PRIORITY_VISIBLE, client_factory: Callable[[], WebClient] | None = None):
+        self.scheduler = scheduler or ApiScheduler(client, client_factory=client_factory)
+        self.priority = priority
+
+    @property
+    def client(self) -> WebClient:
+        return self.scheduler.client
+
+    def with_priority(self, priority: int) -> "ScheduledClient":
+        return ScheduledClient(scheduler=self.scheduler, priority=priority)
+
+    def __getattr__(self, name: str):
+        # anything but an API method (e.g. `token`) is the client's own
+        if not callable(getattr(WebClient, name, None)):
+            return getattr(self.client, name)
+
+        # the client itself isn't touched (or created) until the API call is made
+        def call(**kwargs):
+            return self.scheduler.call(name, self.priority, **kwargs)
+
+        return call
+
+
+def background(slack_client):
+    """The same client, with its calls queued behind the ones for what the user is looking at."""
+    if isinstance(slack_client, ScheduledClient):
+        return slack_client.with_priority(PRIORITY_BACKGROUND)
+    return slack_client
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class BudgetedClient:
+    """Wraps a client and stops making calls once `max_requests` calls or about `max_bytes` of responses are used up.
+
+    Calls past the budget raise `BudgetExhausted` instead of being made.
+    """
+
+    def __init__(self, client, max_requests: int, max_bytes: int):
+        self.client = client
+        self.max_requests = max_requests
+        self.max_bytes = max_bytes
+        self.requests = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def exhausted(self) -> bool:
+        return self.requests >= self.max_requests or self.bytes >= self.max_bytes
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(**kwargs):
+            with self._lock:
+                if self.exhausted():
+                    raise BudgetExhausted(name)
+                self.requests += 1
+            response = attribute(**kwargs)
+            # the size of the response body, give or take its formatting
+            size = len(json.dumps(getattr(response, "data", response), default=str))
+            with self._lock:
+                self.bytes += size
+            return response
+
+        return call
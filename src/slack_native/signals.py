@@ -1,12 +1,14 @@
 from typing import List
 
 from PySide6.QtCore import QObject, Signal
-from PySide6.QtWidgets import QWidget, QScrollArea
+from PySide6.QtWidgets import QWidget
 from qt_async_threads import QtAsyncRunner
 from slack_sdk.web import WebClient
 
-from messages.render import render_messages
+from ui.widgets.messages_browser import MessagesBrowser
 from ui.widgets.messages_page import MessagesPage
+from update_bus import UpdateBus
+from utils.tracing import tracer
 
 class ShowWindowSignal(QObject):
     show_window = Signal()
@@ -14,6 +16,9 @@ class ShowWindowSignal(QObject):
 
 class MessagesUpdatedSignal(QObject):
     messages_updated = Signal(MessagesPage, dict, list)  # Signal carrying a list of messages
+    # a channel's stored history changed (new message, edit or deletion)
+    channel_updated = Signal(str)
+    messages_page: MessagesPage = None
     messages_frame: QWidget = None
     channel_widgets: dict = {}
     selected_channel: str = None
@@ -24,15 +29,36 @@ class MessagesUpdatedSignal(QObject):
         self.slack_client = slack_client
         self.runner = runner
         self.messages_updated.connect(runner.to_sync(self.update_messages_ui))
+        self.channel_updated.connect(runner.to_sync(self.update_channel))
+        # incoming events are batched and merged here, and `channel_updated` is emitted at most once per frame
+        self.update_bus = UpdateBus(self.channel_updated.emit)
+
+    async def update_channel(self, channel_id: str):
+        """Show a channel's stored history again, after an event changed it."""
+        from messages.fetch import fetch_stored_messages, fetch_messages
+        messages_page = self.messages_page
+        # channels that aren't shown pick the change up from the store when they're opened
+        if messages_page is None or channel_id not in messages_page.channel_widgets:
+            return
+        channel = next((channel for channel in messages_page.channels or [] if channel["id"] == channel_id),
+                       {"id": channel_id})
+        messages_browser: MessagesBrowser = messages_page.channel_widgets[channel_id].findChild(MessagesBrowser)
+        # everything newer than the shown page, however many messages arrived; a page of them could leave a gap
+        channel_messages = await fetch_stored_messages(self.slack_client, channel_id,
+                                                       since=messages_browser.refresh_since())
+        if not channel_messages:
+            # the stored history was dropped (see `UpdateBus`), so sync it again
+            channel_messages = await fetch_messages(self.slack_client, channel_id)
+        await self.update_messages_ui(messages_page, channel, channel_messages)
 
     async def update_messages_ui(self, messages_page: MessagesPage, channel: dict, channel_messages: List[dict]):
         channel_id = channel["id"]
         channel_widgets = messages_page.channel_widgets
-        print(f"Channel widgets: {channel_widgets}")
+        # the channel's page may have been evicted since; it's rebuilt from the store when it's shown again
+        if channel_id not in channel_widgets:
+            return
         message_widget: QWidget = channel_widgets[channel_id]
-        message_scroll_area: QScrollArea = message_widget.findChild(QScrollArea)
-        # Log the channel update
-        print(f"Updating messages for channel {channel_id}")
-        print(channel_messages)
+        messages_browser: MessagesBrowser = message_widget.findChild(MessagesBrowser)
+        tracer.instant("update_messages_ui", "render", channel=channel_id, messages=len(channel_messages))
 
-        await render_messages(message_scroll_area, channel_messages)
+        await messages_browser.show_messages(channel_messages)
@@ -0,0 +1,96 @@
+"""Single-instance detection and hand-off, over a local socket (a Unix domain socket, or a named pipe on Windows).
+
+The running instance listens with a `QLocalServer`. A second launch connects with a plain socket before importing
+anything else, sends a one-line message and exits; the protocol is one ASCII command per line, answered with one
+line (`ok`, or e.g. JSON for `stats`).
+"""
+import os
+import socket
+from typing import Callable
+
+from common import APP_DATA_DIR, CURRENT_SYSTEM
+
+MESSAGE_SHOW = b"show"
+# answered with the running instance's diagnostics, as JSON
+MESSAGE_STATS = b"stats"
+ACK = b"ok"
+
+
+def server_name() -> str:
+    if CURRENT_SYSTEM == "Windows":
+        return f"slack_native-{os.environ.get('USERNAME', '')}"
+    # an absolute path, so the socket lives with the app's data rather than in the shared temp directory
+    return os.path.join(APP_DATA_DIR, "instance.sock")
+
+
+def query_running_instance(message: bytes, timeout: float = 1) -> bytes | None:
+    """Send `message` to the running instance and return its answer; None if there isn't a running instance.
+
+    An instance that is still starting up accepts the connection but only answers once its event loop runs; it gets
+    an empty answer, as it will still read the message.
+    """
+    try:
+        if CURRENT_SYSTEM == "Windows":
+            with open(rf"\\.\pipe\{server_name()}", "r+b", buffering=0) as pipe:
+                pipe.write(message + b"\n")
+                return pipe.readline().rstrip(b"\n")
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.settimeout(timeout)
+            connection.connect(server_name())
+            connection.sendall(message + b"\n")
+            try:
+                return connection.makefile("rb").readline().rstrip(b"\n")
+            except TimeoutError:
+                return b""
+    except OSError:
+        return None
+
+
+def notify_running_instance(message: bytes = MESSAGE_SHOW, timeout: float = 1) -> bool:
+    """Send `message` to the running instance; returns False if there isn't one."""
+    return query_running_instance(message, timeout) is not None
+
+
+def listen(on_message: Callable[[bytes], bytes | None]):
+    """Start accepting messages from later launches; returns the server, which must be kept alive.
+
+    Call it as soon as the `QApplication` exists, so a launch during startup finds this instance. `on_message` may
+    return a one-line answer; otherwise `ok` is sent back. Returns None if another instance started listening first
+    (it has been asked to show its window), in which case this one should exit.
+    """
+    from PySide6.QtNetwork import QLocalServer
+
+    server = QLocalServer()
+    name = server_name()
+    if CURRENT_SYSTEM == "Windows":
+        server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+    else:
+        # no socket options here: with them, Qt renames its socket over an existing one, even a live instance's; the
+        # app's data directory already keeps other users out
+        os.makedirs(os.path.dirname(name), exist_ok=True)
+    if not server.listen(name):
+        # another instance may have started listening since `notify_running_instance` was first tried
+        if notify_running_instance(MESSAGE_SHOW):
+            return None
+        # nothing answers, so the socket was left behind by an instance that crashed
+        QLocalServer.removeServer(name)
+        if not server.listen(name):
+            print(f"Error listening for other instances: {server.errorString()}")
+
+    def on_new_connection():
+        while server.hasPendingConnections():
+            connection = server.nextPendingConnection()
+
+            def read(connection=connection):
+                while connection.canReadLine():
+                    answer = on_message(bytes(connection.readLine()).strip())
+                    connection.write((answer or ACK) + b"\n")
+                    connection.flush()
+
+            connection.readyRead.connect(read)
+            connection.disconnected.connect(connection.deleteLater)
+            # the message may have arrived with the connection
+            read()
+
+    server.newConnection.connect(on_new_connection)
+    return server
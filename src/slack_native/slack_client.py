@@ -1,8 +1,15 @@
-import keyring
+from scheduler import ScheduledClient
 
-from mlack import MockClient as WebClient
 
+def create_client():
+    """Create the Web API client; done on the first API call, as reading the keyring is slow."""
+    import keyring
+    from mlack import MockClient as WebClient
 
-# Keyring is cross-platform, e.g: on Windows, it uses the Windows Credential Manager
-slack_token = keyring.get_password("slack_native", "access_token")
-slack_client = WebClient(slack_token)
+    # Keyring is cross-platform, e.g: on Windows, it uses the Windows Credential Manager
+    slack_token = keyring.get_password("slack_native", "access_token")
+    return WebClient(slack_token)
+
+
+# every API call goes through the scheduler, which keeps to Slack's rate limits and puts visible work first
+slack_client = ScheduledClient(client_factory=create_client)
@@ -1,7 +1,7 @@
 from functools import partial
 from typing import List
 
-import darkdetect
+from PySide6.QtCore import QObject, QEvent, QTimer
 from PySide6.QtGui import QPalette, QColor, QIcon
 from PySide6.QtGui import QResizeEvent
 from PySide6.QtWidgets import QApplication, QMainWindow, QStyleFactory, QLabel, QPushButton
@@ -10,12 +10,19 @@ from PySide6.QtWidgets import QWidget
 from qt_async_threads import QtAsyncRunner
 from slack_sdk.errors import SlackApiError
 import sys
+import threading
 
-from slack_native.signals import MessagesUpdatedSignal
-from slack_native.ui.widgets.messages_page import MessagesPage
-from slack_native.ui.widgets.sidebar import SideBar
-from slack_native.ui.widgets.tray import Tray
-from slack_native.slack_client import slack_client
+from signals import MessagesUpdatedSignal
+from ui.widgets.messages_page import MessagesPage
+from ui.widgets.sidebar import SideBar
+from ui.widgets.tray import Tray
+from slack_client import slack_client
+from messages.parse import sync_emojis
+from scheduler import background
+from users.directory import DIRECTORY_REFRESH_INTERVAL_MS, sync_directory
+from common import APP_DATA_DIR
+from conversations.cache import get_cached_channels, cache_channels
+from utils.startup import startup_timeline
 
 
 messages: List[dict] = []
@@ -38,23 +45,20 @@ class MainWindow(QMainWindow):
 
         self.contentStack = None
 
-        try:
-            response = slack_client.users_conversations()
-            channels = response.get("channels")
-            channels.sort(key=lambda x: x["name"])
-        except SlackApiError as e:
-            print(e)
-            channels = []
+        # show the channels from the last session straight away; `refresh_channels` fetches the current list
+        channels = get_cached_channels()
 
         # TODO: add actual pages instead of QLabel placeholders
         runner = QtAsyncRunner()
+        self.runner = runner
+        self.messages_page = MessagesPage(slack_client, self.messages_manager, channels)
 
         async def on_messages_click(messages_page: MessagesPage):
             await messages_page.init()
 
         self.buttons = [
             (QPushButton("Home"), partial(QLabel, "Home Page"), None),
-            (QPushButton("Messages"), partial(MessagesPage, slack_client, self.messages_manager, channels),
+            (QPushButton("Messages"), lambda: self.messages_page,
              runner.to_sync(on_messages_click)),
             (QPushButton("Profile"), partial(QLabel, "Profile Page"), None),
             (QPushButton("Settings"), partial(QLabel, "Settings Page"), None),
@@ -69,6 +73,18 @@ class MainWindow(QMainWindow):
         # Set centralWidget as the central widget of the main window
         self.setCentralWidget(central_widget)
 
+    async def refresh_channels(self):
+        """Fetch the channel list in the background, and replace the cached one shown at startup with it."""
+        try:
+            response = await self.runner.run(slack_client.users_conversations)
+        except SlackApiError as e:
+            print(e)
+            return
+        channels = response.get("channels")
+        channels.sort(key=lambda x: x["name"])
+        await self.runner.run(cache_channels, channels)
+        self.messages_page.set_channels(channels)
+
     def resizeEvent(self, event: QResizeEvent):
         super().resizeEvent(event)
         self.adjust_button_font_size()
@@ -103,25 +119,67 @@ class ThemeManager:
 
     @staticmethod
     def enable_system(app):
+        import darkdetect
         if darkdetect.isDark():
             ThemeManager.enable_dark(app)
         else:
             ThemeManager.enable_light(app)
 
 
-def main(show_window_signal):
-    messages_manager = MessagesUpdatedSignal(slack_client, QtAsyncRunner())
-    app = QApplication(sys.argv)
+class FirstPaintFilter(QObject):
+    """Ends the startup timeline once the window has been painted for the first time."""
+
+    def eventFilter(self, watched, event: QEvent) -> bool:
+        if event.type() == QEvent.Type.Paint:
+            watched.removeEventFilter(self)
+            startup_timeline.mark("first paint")
+            # after the paint has finished
+            QTimer.singleShot(0, lambda: startup_timeline.finish(f"{APP_DATA_DIR}/startup_profile.json"))
+        return False
+
+
+directory_sync: threading.Thread | None = None
+
+
+def start_directory_sync():
+    global directory_sync
+    # a sync can outlast the refresh interval when the workspace is large or Slack is slow; don't start another
+    if directory_sync is not None and directory_sync.is_alive():
+        return
+    directory_sync = threading.Thread(target=sync_directory, args=[background(slack_client)], daemon=True)
+    directory_sync.start()
+
+
+def create_application():
+    with startup_timeline.phase("create application"):
+        messages_manager = MessagesUpdatedSignal(slack_client, QtAsyncRunner())
+        app = QApplication(sys.argv)
+
+        app.setQuitOnLastWindowClosed(False)
+    return app, messages_manager
 
-    app.setQuitOnLastWindowClosed(False)
 
-    window = MainWindow(messages_manager)
-    show_window_signal.show_window.connect(lambda: window.show())
-    ThemeManager.enable_system(app)
-    tray = Tray(window, app)
-    tray.show()
-    # must keep a reference to tray, otherwise it will be garbage collected
-    window.tray = tray
+def main(app, messages_manager, show_window_signal):
+    with startup_timeline.phase("create window"):
+        window = MainWindow(messages_manager)
+        show_window_signal.show_window.connect(lambda: (window.show(), window.raise_(), window.activateWindow()))
+        ThemeManager.enable_system(app)
+        tray = Tray(window, app)
+        tray.show()
+        # must keep a reference to tray, otherwise it will be garbage collected
+        window.tray = tray
+    first_paint_filter = FirstPaintFilter(window)
+    window.installEventFilter(first_paint_filter)
     window.show()
+    # everything that needs the network happens once the window is up
+    window.runner.start_coroutine(window.refresh_channels())
+    # download the workspace's custom emojis in the background, so rendering never waits for them
+    threading.Thread(target=sync_emojis, args=[slack_client], daemon=True).start()
+    # fill the user cache from the directory, so authors are rarely looked up one at a time while rendering
+    window.directory_timer = QTimer(window)
+    window.directory_timer.setInterval(DIRECTORY_REFRESH_INTERVAL_MS)
+    window.directory_timer.timeout.connect(start_directory_sync)
+    window.directory_timer.start()
+    start_directory_sync()
     app.aboutToQuit.connect(lambda: sys.exit(0))
-    return app, window, messages_manager
+    return window
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from functools import partial
 from typing import List
 
@@ -7,73 +8,124 @@ from PySide6.QtWidgets import QListWidget, QListWidgetItem, QWidget, QVBoxLayout
 from qt_async_threads import QtAsyncRunner
 from slack_sdk import WebClient
 
-from messages.fetch import fetch_messages
+from messages.fetch import fetch_messages, fetch_stored_messages
+from messages.warmer import ChannelWarmer
 from ui.widgets.messages_browser import MessagesBrowser
+from utils.tracing import tracer
+
+
+# the most channel pages kept alive; the least recently viewed ones are deleted past this, and rebuilt from the
+# stored history when they're viewed again
+MAX_CHANNEL_PAGES = 8
 
 
 class ChannelsList:
-    def __init__(self, slack_client: WebClient, channels: List[dict], messages_updated_signal, messages_page):
-        self.channel_widgets = {}
+    def __init__(self, slack_client: WebClient, channels: List[dict], messages_updated_signal, messages_page,
+                 max_pages: int = MAX_CHANNEL_PAGES):
+        # the pages of the most recently viewed channels, least recently viewed first; created when first shown
+        self.channel_widgets: OrderedDict[str, QWidget] = OrderedDict()
+        self.max_pages = max_pages
         self.selected_channel = None
         self.channels = channels
         self.slack_client = slack_client
         self.channels_list_widget = QListWidget()
         self.messages_updated_signal = messages_updated_signal
         self.messages_page = messages_page
-        # Dictionary to store scrollable widgets for each channel
-        channel_widgets = self.channel_widgets
 
         # Channels list area
         channels_list_widget = self.channels_list_widget
-        if channels:
-            for channel in channels:
-                item = QListWidgetItem(channel["name"])
-                item.setData(Qt.ItemDataRole.UserRole, channel)
-                channels_list_widget.addItem(item)
-
-                widget = QWidget()
-                layout = QVBoxLayout(widget)
-                label = QLabel(f"Messages for {channel['name']}")
-                label.setFont(QFont("Arial", 20))
-                label.setAlignment(Qt.AlignmentFlag.AlignHCenter)
-                layout.addWidget(label)
-
-                messages_browser = MessagesBrowser(channel, self.slack_client)
-                layout.addWidget(messages_browser)
+        self.add_items(channels)
 
-                channel_widgets[channel["id"]] = widget
+        # preloads the channels likely to be opened next, so switching to them shows their history straight away
+        self.warmer = ChannelWarmer(slack_client, channels or [])
+        self.warmer.start_when_idle()
 
         runner = QtAsyncRunner()
         channels_list_widget.itemPressed.connect(
             lambda item: runner.to_sync(self.on_channel_selected)(item))
-        for channel_id, widget in channel_widgets.items():
-            widget.setVisible(False)
+
+    def add_items(self, channels: List[dict]):
+        if channels:
+            for channel in channels:
+                item = QListWidgetItem(channel["name"])
+                item.setData(Qt.ItemDataRole.UserRole, channel)
+                self.channels_list_widget.addItem(item)
+
+    def set_channels(self, channels: List[dict]):
+        """Replace the listed channels; pages of channels that are still listed are kept."""
+        self.channels = channels
+        self.warmer.channels = channels
+        self.channels_list_widget.clear()
+        self.add_items(channels)
+
+    def create_page(self, channel: dict) -> QWidget:
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+        label = QLabel(f"Messages for {channel['name']}")
+        label.setFont(QFont("Arial", 20))
+        label.setAlignment(Qt.AlignmentFlag.AlignHCenter)
+        layout.addWidget(label)
+
+        messages_browser = MessagesBrowser(channel, self.slack_client)
+        layout.addWidget(messages_browser)
+        widget.setVisible(False)
+        # pages go before the channels list
+        self.messages_page.splitter.insertWidget(0, widget)
+        return widget
+
+    def page(self, channel: dict) -> QWidget:
+        """Return the page of a channel, creating it if it doesn't exist (anymore)."""
+        channel_widgets = self.channel_widgets
+        widget = channel_widgets.get(channel["id"])
+        if widget is None:
+            widget = channel_widgets[channel["id"]] = self.create_page(channel)
+            self.evict_pages()
+        channel_widgets.move_to_end(channel["id"])
+        return widget
+
+    def evict_pages(self):
+        channel_widgets = self.channel_widgets
+        for channel_id in list(channel_widgets):
+            if len(channel_widgets) <= self.max_pages:
+                break
+            if channel_id == self.selected_channel:
+                continue
+            widget = channel_widgets.pop(channel_id)
+            # coroutines may still be waiting on fetches for the page; they check this once they resume
+            widget.findChild(MessagesBrowser).discard()
+            widget.setParent(None)
+            widget.deleteLater()
 
     async def on_channel_selected(self, item: QListWidgetItem):
         channel = item.data(Qt.ItemDataRole.UserRole)
-        print(f"Channel selected: {channel['name']}")
-
         if self.selected_channel == channel["id"]:
-            print("Channel already selected")
             return
+        tracer.instant("channel_selected", "ui", channel=channel["id"])
 
         self.show_channel(channel)
-
-        channel_messages = await fetch_messages(self.slack_client, channel["id"])
-        print(f"Channel messages: {channel_messages}")
+        self.warmer.record_switch(channel["id"])
+
+        self.warmer.foreground += 1
+        try:
+            # show what's stored (e.g. warmed in the background) first, then whatever is new
+            channel_messages = await fetch_stored_messages(self.slack_client, channel["id"])
+            if channel_messages:
+                self.messages_updated_signal.messages_updated.emit(self.messages_page, channel, channel_messages)
+            channel_messages = await fetch_messages(self.slack_client, channel["id"])
+        finally:
+            self.warmer.foreground -= 1
         self.messages_updated_signal.messages_updated.emit(self.messages_page, channel, channel_messages)
 
     def show_channel(self, channel: dict):
         channel_widgets = self.channel_widgets
-        print("channel_widgets", channel_widgets)
         # Hide the previously selected channel's messages widget
         if channel_widgets:
             if self.selected_channel in channel_widgets:
                 channel_widgets[self.selected_channel].setVisible(False)
 
-        # Reassign the selected channel
-        self.selected_channel = channel["id"]
-
-        # Show the selected channel's messages widget
+        # Show the selected channel's messages widget, creating it if it's the first time it's shown
         if channel:
-            channel_widgets[channel["id"]].setVisible(True)
+            widget = self.page(channel)
+            # Reassign the selected channel
+            self.selected_channel = channel["id"]
+            widget.setVisible(True)
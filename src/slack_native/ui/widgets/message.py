@@ -1,71 +1,229 @@
-from functools import partial
+import math
+import re
+from collections import OrderedDict
+from datetime import datetime
 
-from PySide6.QtGui import QTextCharFormat, QFont, QTextCursor
-from PySide6.QtWidgets import QPushButton, QLayout, QWidget, QVBoxLayout, QScrollArea
-from qt_async_threads import QtAsyncRunner
+from PySide6.QtCore import Qt, QRect, QSize, QEvent, QUrl, QModelIndex, QPoint, QPointF
+from PySide6.QtGui import QFont, QFontMetrics, QTextDocument, QPixmap, QDesktopServices, QPainter
+from PySide6.QtWidgets import QStyledItemDelegate, QStyleOptionViewItem, QStyle
 
-from messages.fetch import fetch_replies
-from slack_client import slack_client
-from ui.widgets.text_browser import TextBrowser
-from ui.widgets.thread_sidebar import ThreadSidebar
-from utils.image_processing import RoundedImage
+from users.avatars import AVATAR_SIZE
+from utils.avatar_cache import avatar_cache
+from utils.tracing import tracer
 
+MESSAGE_ROLE = Qt.ItemDataRole.UserRole
+PADDING = 8
+# half the size, so avatars are round
+AVATAR_RADIUS = AVATAR_SIZE // 2
+REPLIES_HEIGHT = 24
 
-async def show_replies(message: dict, parent: QWidget):
-    print("Showing replies")
-    if not parent.findChild(ThreadSidebar):
-        replies_widget = ThreadSidebar(message["channel"], parent)
-    else:
-        replies_widget = parent.findChild(ThreadSidebar)
-    replies = await fetch_replies(slack_client, message["channel"], message["ts"])
-    replies_widget.thread_sidebar_updated.thread_sidebar_updated.emit(replies)
+tag_pattern = re.compile(r'<[^>]+>')
 
 
+def is_thread_parent(message: dict) -> bool:
+    return "thread_ts" in message and float(message["thread_ts"]) == float(message["ts"])
+
+
+def replies_label(message: dict) -> str:
+    """The text of a thread parent's replies link, e.g. "3 replies · Last reply 14:05"."""
+    reply_count = message.get("reply_count")
+    if not reply_count:
+        return "Show replies"
+    label = f"{reply_count} {'reply' if reply_count == 1 else 'replies'}"
+    if message.get("latest_reply"):
+        latest_reply = datetime.fromtimestamp(float(message["latest_reply"]))
+        if latest_reply.date() == datetime.now().date():
+            label += f" · Last reply {latest_reply:%H:%M}"
+        else:
+            label += f" · Last reply {latest_reply:%d %b}"
+    return label
+
+
+def message_key(message: dict) -> tuple:
+    """Identify a message's rendered content; edits and new replies change the key, so cached layouts are dropped."""
+    return message["ts"], (message.get("edited") or {}).get("ts"), message.get("latest_reply")
+
+
+class MessageDelegate(QStyledItemDelegate):
+    """Lays out and paints a message (avatar, author and HTML text) directly, without a widget per message.
+
+    Only the rows in view are painted; row heights and text layouts are cached here, and avatars in the shared
+    `avatar_cache`.
+    """
+
+    def __init__(self, parent=None, font_size: int = 14, max_cached_documents: int = 512,
+                 max_cached_heights: int = 8192):
+        super().__init__(parent)
+        self.base_font = QFont(parent.font()) if parent is not None else QFont()
+        self.font_size = font_size
+        self.max_cached_documents = max_cached_documents
+        # every width the view is resized through adds a height per row, so these are evicted too
+        self.max_cached_heights = max_cached_heights
+        self._documents: OrderedDict[tuple, QTextDocument] = OrderedDict()
+        self._heights: OrderedDict[tuple, int] = OrderedDict()
+        self._update_fonts()
+        avatar_cache.loaded.connect(self._on_avatar_loaded)
+
+    @staticmethod
+    def message(index: QModelIndex) -> dict:
+        # read the model's list directly; `index.data()` would convert the whole dict to and from a QVariant
+        model = index.model()
+        if hasattr(model, "messages"):
+            return model.messages[index.row()]
+        return index.data(MESSAGE_ROLE)
+
+    def _update_fonts(self):
+        self.name_font = QFont(self.base_font)
+        self.name_font.setPointSize(self.font_size + 2)
+        self.name_font.setWeight(QFont.Weight.Bold)
+        self.name_height = QFontMetrics(self.name_font).height()
+        self.text_font = QFont(self.base_font)
+        self.text_font.setPixelSize(self.font_size + 4)
+        text_metrics = QFontMetrics(self.text_font)
+        self.line_height = text_metrics.lineSpacing()
+        self.average_char_width = max(1, text_metrics.averageCharWidth())
+
+    def set_font_size(self, font_size: int):
+        self.font_size = max(1, font_size)
+        self._update_fonts()
+        self.clear_caches()
+
+    def clear_caches(self):
+        self._documents.clear()
+        self._heights.clear()
+
+    def forget(self, message: dict):
+        """Drop the cached layout of a message, e.g. after it has been edited."""
+        key = message_key(message)
+        self._documents.pop(key, None)
+        for height_key in [height_key for height_key in self._heights if height_key[0] == key]:
+            del self._heights[height_key]
+
+    def _document(self, message: dict, width: int) -> QTextDocument:
+        key = message_key(message)
+        document = self._documents.get(key)
+        if document is None:
+            with tracer.span("layout_message", "render"):
+                document = QTextDocument()
+                document.setDocumentMargin(0)
+                document.setDefaultFont(self.text_font)
+                document.setHtml(message["text"])
+            self._documents[key] = document
+            while len(self._documents) > self.max_cached_documents:
+                self._documents.popitem(last=False)
+        else:
+            self._documents.move_to_end(key)
+        if document.textWidth() != width:
+            document.setTextWidth(width)
+        return document
 
-class Message:
     @staticmethod
-    async def write(scroll_area: QScrollArea, message: dict):
-        buttons = []
-        message_widget = QWidget()
-        message_layout = QVBoxLayout()
-        message_widget.setLayout(message_layout)
-        text_browser = TextBrowser()
-        message_layout.addWidget(text_browser)
-        # Create a text browser to render the message
-        parent = scroll_area.widget().layout()
-        parent.addWidget(message_widget)
-        cur = text_browser.textCursor()
-        cur.movePosition(QTextCursor.MoveOperation.End)
-        data_url = message["user"]["profile"]["image_48"]
-
-        print("also person being rendered is", message["user"]["profile"]["real_name"])
-        print("thread_ts" in message, message["ts"], message["thread_ts"] if "thread_ts" in message else None)
-
-        cur.insertImage(RoundedImage(data_url, 50))
-
-        user_format = QTextCharFormat()
-        user_format.setFontPointSize(20)
-        user_format.setFontWeight(QFont.Weight.Bold)
-        cur.insertText(f"\n{message['user']['profile']['real_name']}\n", user_format)
-
-        text_format = "font-size: 18px;"
-        cur.insertHtml(f"<p style=\"{text_format}\">{message['text']}</p>\n")
-        if "thread_ts" in message:
-            print(message["thread_ts"], message["ts"])
-            print(float(message["thread_ts"]) == float(message["ts"]))
-
-        # if the message is a parent message with replies (message is a thread), display a button to show the replies
-        if "thread_ts" in message and float(message["thread_ts"]) == float(message["ts"]):
-            print("Parent message with replies")
-            button = QPushButton("Show replies")
-            button.size = 20
-            button.setParent(message_widget)
-
-            runner = QtAsyncRunner()
-            parent_parent = scroll_area.parent().parent().parent()
-            print("Parent parent", parent_parent)
-            parent_parent.children().append(button)
-            button.clicked.connect(partial(runner.to_sync(show_replies), message, parent_parent))
-            message_layout.addWidget(button)
-
-            buttons.append(button)  # Keep a reference to prevent garbage collection
+    def _avatar(user: dict, device_pixel_ratio: float) -> QPixmap | None:
+        path = user["profile"].get("avatar_path")
+        if not isinstance(path, str):
+            return None
+        return avatar_cache.get(user.get("id", path), path, AVATAR_SIZE, AVATAR_RADIUS, device_pixel_ratio)
+
+    def _on_avatar_loaded(self, _key: tuple):
+        # the avatar is drawn with the next paint; repaints are coalesced by Qt
+        view = self.parent()
+        if view is not None:
+            view.viewport().update()
+
+    @staticmethod
+    def _text_rect(rect: QRect) -> QRect:
+        left = rect.left() + PADDING * 2 + AVATAR_SIZE
+        return QRect(left, rect.top() + PADDING, max(1, rect.right() - PADDING - left), rect.height() - PADDING * 2)
+
+    def _replies_rect(self, rect: QRect) -> QRect:
+        text_rect = self._text_rect(rect)
+        return QRect(text_rect.left(), rect.bottom() - PADDING - REPLIES_HEIGHT, text_rect.width(), REPLIES_HEIGHT)
+
+    def _row_height(self, message: dict, text_height: int) -> int:
+        height = max(AVATAR_SIZE, self.name_height + text_height) + PADDING * 2
+        if is_thread_parent(message):
+            height += REPLIES_HEIGHT
+        return height
+
+    def has_height(self, message: dict, width: int) -> bool:
+        return (message_key(message), width) in self._heights
+
+    def height(self, message: dict, width: int) -> int:
+        """The exact height of a message's row, laying its text out if it hasn't been measured at this width yet."""
+        key = (message_key(message), width)
+        height = self._heights.get(key)
+        if height is None:
+            text_width = self._text_rect(QRect(0, 0, width, 0)).width()
+            text_height = math.ceil(self._document(message, text_width).size().height())
+            height = self._row_height(message, text_height)
+            self._heights[key] = height
+            while len(self._heights) > self.max_cached_heights:
+                self._heights.popitem(last=False)
+        else:
+            self._heights.move_to_end(key)
+        return height
+
+    def estimate_height(self, message: dict, width: int) -> int:
+        """A cheap guess of a message's row height, for rows that haven't been shown yet."""
+        height = self._heights.get((message_key(message), width))
+        if height is not None:
+            return height
+        text_width = self._text_rect(QRect(0, 0, width, 0)).width()
+        text_length = len(tag_pattern.sub("", message["text"]))
+        lines = max(1, math.ceil(text_length * self.average_char_width / text_width))
+        return self._row_height(message, lines * self.line_height)
+
+    def sizeHint(self, option: QStyleOptionViewItem, index: QModelIndex) -> QSize:
+        width = option.rect.width()
+        if width <= 0 and option.widget is not None:
+            width = option.widget.viewport().width()
+        return QSize(width, self.height(self.message(index), width))
+
+    def paint(self, painter: QPainter, option: QStyleOptionViewItem, index: QModelIndex):
+        message = self.message(index)
+        rect = option.rect
+        painter.save()
+        painter.setClipRect(rect)
+        if option.state & QStyle.StateFlag.State_MouseOver:
+            painter.fillRect(rect, option.palette.alternateBase())
+
+        avatar = self._avatar(message["user"], painter.device().devicePixelRatioF())
+        if avatar is not None:
+            painter.drawPixmap(rect.left() + PADDING, rect.top() + PADDING, avatar)
+
+        text_rect = self._text_rect(rect)
+        painter.setFont(self.name_font)
+        painter.setPen(option.palette.text().color())
+        painter.drawText(QRect(text_rect.left(), text_rect.top(), text_rect.width(), self.name_height),
+                         Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+                         message["user"]["profile"]["real_name"])
+
+        document = self._document(message, text_rect.width())
+        painter.translate(text_rect.left(), text_rect.top() + self.name_height)
+        document.drawContents(painter)
+        painter.restore()
+
+        # if the message is a parent message with replies (message is a thread), display a link to show the replies
+        if is_thread_parent(message):
+            painter.save()
+            painter.setPen(option.palette.link().color())
+            painter.drawText(self._replies_rect(rect), Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+                             replies_label(message))
+            painter.restore()
+
+    def editorEvent(self, event: QEvent, model, option: QStyleOptionViewItem, index: QModelIndex) -> bool:
+        if event.type() != QEvent.Type.MouseButtonRelease or event.button() != Qt.MouseButton.LeftButton:
+            return False
+        message = self.message(index)
+        pos = event.position().toPoint()
+        if is_thread_parent(message) and self._replies_rect(option.rect).contains(pos):
+            self.parent().replies_requested.emit(message)
+            return True
+        # open links in the message text
+        text_rect = self._text_rect(option.rect)
+        document = self._document(message, text_rect.width())
+        anchor = document.documentLayout().anchorAt(QPointF(pos - text_rect.topLeft() - QPoint(0, self.name_height)))
+        if anchor:
+            QDesktopServices.openUrl(QUrl(anchor))
+            return True
+        return False
@@ -1,37 +1,166 @@
 import math
-from functools import partial
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QFont, QWheelEvent, QPalette
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QLineEdit, QTextBrowser, QPushButton, QScrollArea
+from typing import List
 
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QLineEdit
+from qt_async_threads import QtAsyncRunner
+
+from common import HISTORY_PAGE_SIZE
 from messages.send import send_message
-from ui.widgets.text_browser import TextBrowser
+from ui.widgets.messages_view import MessagesView
 from slack_sdk.web import WebClient
 
 
-def send_message_on_return(slack_client: WebClient, input_element: QLineEdit, channel: dict):
+async def send_message_on_return(runner: QtAsyncRunner, slack_client: WebClient, input_element: QLineEdit,
+                                 channel: dict):
     text = input_element.text()
     input_element.clear()
-    send_message(slack_client, channel["id"], text)
+    # on a worker thread, as the scheduler may hold the call back for chat.postMessage's rate limit or a Retry-After
+    await runner.run(send_message, slack_client, channel["id"], text)
 
 
 class MessagesBrowser(QWidget):
-    def __init__(self, channel: dict, slack_client: WebClient):
+    def __init__(self, channel: dict, slack_client: WebClient, page_size: int = HISTORY_PAGE_SIZE):
         super().__init__()
         self.slack_client = slack_client
-        message_widget = QWidget()
-        message_widget.setLayout(QVBoxLayout())
-        messages_browser = QScrollArea()
-        self.messages_browser = messages_browser
-        messages_browser.setWidgetResizable(True)
-        messages_browser.setWidget(message_widget)
+        self.channel = channel
+        self.page_size = page_size
+        messages_view = MessagesView()
+        self.messages_view = messages_view
+        messages_view.replies_requested.connect(self.on_replies_requested)
+        messages_view.replies_wanted.connect(self.on_replies_wanted)
 
         scroll_layout = QVBoxLayout(self)
         self.scroll_layout = scroll_layout
-        scroll_layout.addWidget(messages_browser)
+        scroll_layout.addWidget(messages_view)
 
+        self.runner = QtAsyncRunner()
         message_input = QLineEdit()
 
-        message_input.returnPressed.connect(
-            partial(send_message_on_return, self.slack_client, message_input, channel))
+        message_input.returnPressed.connect(lambda: self.runner.start_coroutine(
+            send_message_on_return(self.runner, self.slack_client, message_input, channel)))
         scroll_layout.addWidget(message_input)
+
+        # pagination state for older history; `oldest_ts` stays None until a channel's messages are shown
+        self.oldest_ts: str | None = None
+        self.history_cursor: str | None = None
+        self.history_exhausted = False
+        self._loading = False
+        self._wants_page = False
+        self._prefetched: List[dict] | None = None
+        # bumped whenever the channel is re-rendered, so a page fetched for the previous render is dropped
+        self._generation = 0
+        # set once the page is about to be deleted; its widgets mustn't be touched after that
+        self.discarded = False
+        # distance from the bottom of the scroll area to keep while older messages are inserted above
+        self._anchor: int | None = None
+
+        scroll_bar = messages_view.verticalScrollBar()
+        scroll_bar.valueChanged.connect(self.on_scroll)
+        scroll_bar.rangeChanged.connect(self.on_scroll_range_changed)
+
+    async def show_messages(self, channel_messages: List[dict]):
+        """Merge the newest messages of the channel into the view; on the first render, start prefetching history.
+
+        If the messages are all newer than what's shown (e.g. more arrived than fit in a page), there'd be a gap
+        between them and the shown ones, so they replace the view and history is paged in again from them.
+        """
+        from messages.render import render_messages
+        model = self.messages_view.model()
+        first_render = model.rowCount() == 0 or not model.overlaps(channel_messages)
+        if first_render:
+            self.oldest_ts = channel_messages[0]["ts"] if channel_messages else None
+            self.history_cursor = None
+            self.history_exhausted = self.oldest_ts is None
+            self._prefetched = None
+            self._wants_page = False
+            self._generation += 1
+            # the newest message is at the bottom, so start scrolled all the way down
+            self._anchor = 0
+        await render_messages(self.messages_view, channel_messages, replace=first_render)
+        if first_render:
+            await self.prefetch_older()
+
+    def refresh_since(self) -> str | None:
+        """The `ts` stored messages are reloaded from after an event: the newest page shown, so edits and deletions
+        there are picked up, along with every newer message."""
+        shown = self.messages_view.model().messages
+        if not shown:
+            return None
+        return shown[max(0, len(shown) - self.page_size)]["ts"]
+
+    def near_top(self) -> bool:
+        # within a screen's height of the top, so the next page is usually ready before the top is reached
+        return self.messages_view.verticalScrollBar().value() <= self.messages_view.viewport().height()
+
+    def on_scroll(self, _value: int):
+        if not self.near_top() or self.oldest_ts is None:
+            return
+        if self._prefetched is not None:
+            self.runner.start_coroutine(self.show_prefetched())
+        elif not self.history_exhausted:
+            self._wants_page = True
+            self.runner.start_coroutine(self.prefetch_older())
+
+    def on_scroll_range_changed(self, _minimum: int, maximum: int):
+        if self._anchor is not None:
+            self.messages_view.verticalScrollBar().setValue(maximum - self._anchor)
+            self._anchor = None
+
+    def on_replies_requested(self, message: dict):
+        from ui.widgets.thread_sidebar import show_replies
+        # the thread sidebar is added next to the channel's page
+        self.runner.start_coroutine(show_replies(message, self.parent().parent()))
+
+    def on_replies_wanted(self, message: dict):
+        from messages.replies import replies_loader
+        # only starts the request in the background; the replies are annotated once they're shown
+        replies_loader.prefetch(self.slack_client, message)
+
+    def discard(self):
+        """Called before the page is deleted, so coroutines still waiting on a fetch for it drop their results."""
+        self.discarded = True
+        self._generation += 1
+
+    async def prefetch_older(self):
+        """Load the page preceding the oldest shown message in the background, without rendering it."""
+        if (self.discarded or self._loading or self.history_exhausted or self._prefetched is not None
+                or self.oldest_ts is None):
+            return
+        from messages.fetch import fetch_older_messages
+        from scheduler import background
+        self._loading = True
+        generation = self._generation
+        # unless the user is waiting for the page at the top, it's only a prefetch
+        slack_client = self.slack_client if self._wants_page else background(self.slack_client)
+        try:
+            channel_messages, oldest_ts, history_cursor, has_more = await fetch_older_messages(
+                slack_client, self.channel["id"], self.oldest_ts, self.history_cursor, self.page_size)
+        finally:
+            self._loading = False
+        # a page for a previous render (or a deleted page) mustn't touch the pagination state reset since
+        if generation != self._generation:
+            await self.prefetch_older()
+            return
+        self.history_cursor = history_cursor
+        model = self.messages_view.model()
+        self._prefetched = [message for message in channel_messages if model.row_of(message["ts"]) < 0]
+        if oldest_ts is not None:
+            self.oldest_ts = oldest_ts
+        self.history_exhausted = not has_more
+        if self._wants_page or self.near_top():
+            await self.show_prefetched()
+
+    async def show_prefetched(self):
+        """Insert the prefetched page above the shown messages, keeping the scroll position anchored."""
+        from messages.render import prepend_messages
+        channel_messages = self._prefetched
+        if channel_messages is None:
+            return
+        self._prefetched = None
+        # if the page had nothing new to show, show the next one as soon as it arrives
+        self._wants_page = not channel_messages
+        if channel_messages:
+            scroll_bar = self.messages_view.verticalScrollBar()
+            self._anchor = scroll_bar.maximum() - scroll_bar.value()
+            await prepend_messages(self.messages_view, channel_messages)
+        await self.prefetch_older()
@@ -17,6 +17,16 @@ class MessagesPage(QWidget):
         self.slack_client = slack_client
         self.selected_channel = None
         self.channels = channels
+        self.channels_list: ChannelsList | None = None
+
+    def set_channels(self, channels: List[dict]):
+        """Replace the channel list, e.g. once the current list has been fetched."""
+        self.channels = channels
+        if self.channels_list is not None:
+            had_channels = bool(self.channels_list.channels)
+            self.channels_list.set_channels(channels)
+            if not had_channels and channels:
+                self.channels_list.show_channel(channels[0])
 
     async def init(self):
         channels = self.channels
@@ -28,20 +38,21 @@ class MessagesPage(QWidget):
         # create a QSplitter to allow resizing of the channel list and the messages
         splitter = QSplitter(Qt.Orientation.Horizontal)
         main_layout.addWidget(splitter)
+        # channel pages are inserted here as they're first shown
+        self.splitter = splitter
 
         channels = ChannelsList(self.slack_client, channels, self.messages_updated_signal, self)
 
-        for widget in channels.channel_widgets.values():
-            splitter.addWidget(widget)
-            widget.setVisible(False)
-
         channel_widgets = channels.channel_widgets
 
         splitter.addWidget(channels.channels_list_widget)
 
         self.channel_widgets = channel_widgets
+        # events for this page's channels are shown as they arrive
+        self.messages_updated_signal.messages_page = self
+        self.channels_list = channels
 
-        if channels:
+        if channels.channels:
             channels.show_channel(channels.channels[0])
         # add thread sidebar
         # for now add test data here
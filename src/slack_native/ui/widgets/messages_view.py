@@ -0,0 +1,264 @@
+from bisect import bisect_left, bisect_right
+from typing import List, Any
+
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex, Signal, QTimer
+from PySide6.QtWidgets import QTableView, QAbstractItemView, QHeaderView
+
+from ui.widgets.message import MessageDelegate, MESSAGE_ROLE, message_key, is_thread_parent
+from utils.tracing import tracer
+
+# the most rows measured exactly at once; rows beyond that get an estimated height until they are painted
+EXACT_HEIGHT_ROWS = 100
+
+
+class MessagesModel(QAbstractListModel):
+    """A list model of a channel's messages, oldest first, indexed by `ts`.
+
+    Incoming messages are compared against the ones already in the model, so only the rows that actually changed
+    are inserted, updated or removed.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.messages: List[dict] = []
+        # `float(ts)` of each row, kept in step with `messages` to find rows by bisection
+        self.timestamps: List[float] = []
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole) -> Any:
+        if not index.isValid():
+            return None
+        message = self.messages[index.row()]
+        if role == MESSAGE_ROLE:
+            return message
+        if role == Qt.ItemDataRole.DisplayRole:
+            return message["text"]
+        return None
+
+    def row_of(self, ts: str) -> int:
+        """Return the row of the message `ts`, or -1 if it isn't in the model."""
+        row = bisect_left(self.timestamps, float(ts))
+        if row < len(self.messages) and self.messages[row]["ts"] == ts:
+            return row
+        return -1
+
+    def set_messages(self, channel_messages: List[dict]):
+        self.beginResetModel()
+        self.messages = sorted(channel_messages, key=lambda message: float(message["ts"]))
+        self.timestamps = [float(message["ts"]) for message in self.messages]
+        self.endResetModel()
+
+    def overlaps(self, channel_messages: List[dict]) -> bool:
+        """Whether a batch reaches back to the newest message in the model, so merging it leaves no gap."""
+        if not self.timestamps or not channel_messages:
+            return True
+        return min(float(message["ts"]) for message in channel_messages) <= self.timestamps[-1]
+
+    def apply_messages(self, channel_messages: List[dict]):
+        """Merge a contiguous batch of messages into the model.
+
+        Messages that aren't in the model yet are inserted, changed ones are updated in place, and messages in the
+        batch's time range that are missing from the batch are removed (they have been deleted).
+        """
+        if not self.messages:
+            self.set_messages(channel_messages)
+            return
+        if not channel_messages:
+            return
+        batch_ts = {message["ts"] for message in channel_messages}
+        oldest = min(float(ts) for ts in batch_ts)
+        newest = max(float(ts) for ts in batch_ts)
+        first = bisect_left(self.timestamps, oldest)
+        last = bisect_right(self.timestamps, newest)
+        for message in [message for message in self.messages[first:last] if message["ts"] not in batch_ts]:
+            self.remove_message(message["ts"])
+
+        new_messages = []
+        for message in channel_messages:
+            if self.row_of(message["ts"]) >= 0:
+                self.update_message(message)
+            else:
+                new_messages.append(message)
+        self.insert_messages(new_messages)
+
+    def insert_messages(self, channel_messages: List[dict]):
+        """Insert messages that aren't in the model yet, as one row insertion per run of adjacent messages."""
+        channel_messages = sorted(channel_messages, key=lambda message: float(message["ts"]))
+        i = 0
+        while i < len(channel_messages):
+            row = bisect_right(self.timestamps, float(channel_messages[i]["ts"]))
+            next_ts = self.timestamps[row] if row < len(self.timestamps) else float("inf")
+            j = i + 1
+            while j < len(channel_messages) and float(channel_messages[j]["ts"]) < next_ts:
+                j += 1
+            run = channel_messages[i:j]
+            self.beginInsertRows(QModelIndex(), row, row + len(run) - 1)
+            self.messages[row:row] = run
+            self.timestamps[row:row] = [float(message["ts"]) for message in run]
+            self.endInsertRows()
+            i = j
+
+    def upsert_message(self, message: dict):
+        if self.row_of(message["ts"]) >= 0:
+            self.update_message(message)
+        else:
+            self.insert_messages([message])
+
+    def update_message(self, message: dict) -> bool:
+        """Replace a message in place, if its content has changed."""
+        row = self.row_of(message["ts"])
+        if row < 0:
+            return False
+        current = self.messages[row]
+        if message_key(current) == message_key(message) and current["text"] == message["text"]:
+            return False
+        self.messages[row] = message
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def remove_message(self, ts: str) -> bool:
+        row = self.row_of(ts)
+        if row < 0:
+            return False
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.messages[row]
+        del self.timestamps[row]
+        self.endRemoveRows()
+        return True
+
+
+class MessagesView(QTableView):
+    """Shows a channel's messages; only the rows in view are laid out and painted.
+
+    Row heights are kept by the (vertical) header, so laying the view out never has to go through every message.
+    Rows are measured exactly when they're added; past `EXACT_HEIGHT_ROWS` at once, the rest get an estimated height
+    that is corrected the first time they're painted.
+    """
+    replies_requested = Signal(dict)
+    # emitted for thread parents that are hovered or scrolled into view, so their replies can be prefetched
+    replies_wanted = Signal(dict)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.default_font_size = 14
+        model = MessagesModel(self)
+        self.setModel(model)
+        self.setItemDelegate(MessageDelegate(self, self.default_font_size))
+        self.horizontalHeader().hide()
+        self.horizontalHeader().setStretchLastSection(True)
+        self.verticalHeader().hide()
+        self.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.verticalHeader().setMinimumSectionSize(1)
+        self.setShowGrid(False)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setMouseTracking(True)
+
+        # the width the row heights were computed for
+        self.rows_width = 0
+        self._refine_rows_pending = False
+        # (ts, latest_reply) of the thread parents `replies_wanted` has been emitted for
+        self._replies_wanted: set[tuple] = set()
+        self.entered.connect(lambda index: self.want_replies(self.model().messages[index.row()]))
+        self._resize_timer = QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.setInterval(100)
+        self._resize_timer.timeout.connect(self.size_all_rows)
+        model.modelReset.connect(self.size_all_rows)
+        model.rowsInserted.connect(lambda _parent, first, last: self.size_rows(first, last))
+        model.dataChanged.connect(lambda top_left, bottom_right, _roles=None: self.size_rows(top_left.row(), bottom_right.row()))
+
+    def size_rows(self, first: int, last: int):
+        delegate: MessageDelegate = self.itemDelegate()
+        messages = self.model().messages
+        header = self.verticalHeader()
+        width = self.rows_width = self.viewport().width()
+        exact_from = max(first, last + 1 - EXACT_HEIGHT_ROWS)
+        # with updates and signals off, the header doesn't recompute every section's position for each resize
+        header.setUpdatesEnabled(False)
+        header.blockSignals(True)
+        try:
+            for row in range(first, last + 1):
+                message = messages[row]
+                if row >= exact_from:
+                    header.resizeSection(row, delegate.height(message, width))
+                else:
+                    header.resizeSection(row, delegate.estimate_height(message, width))
+        finally:
+            header.blockSignals(False)
+            header.setUpdatesEnabled(True)
+        self.updateGeometries()
+        self.viewport().update()
+
+    def size_all_rows(self):
+        if self.model().rowCount() > 0:
+            self.size_rows(0, self.model().rowCount() - 1)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.viewport().width() != self.rows_width:
+            # the visible rows are corrected as they're painted; the rest are re-sized once resizing settles
+            self.rows_width = self.viewport().width()
+            self._resize_timer.start()
+
+    def paintEvent(self, event):
+        with tracer.span("paint_messages", "render", rows=self.model().rowCount()):
+            super().paintEvent(event)
+        if not self._refine_rows_pending and self.model().rowCount() > 0:
+            self._refine_rows_pending = True
+            # the header can't be resized while painting, so correct the painted rows' heights afterwards
+            QTimer.singleShot(0, self.refine_visible_rows)
+
+    def refine_visible_rows(self):
+        """Replace the estimated heights of the rows in view with their exact heights."""
+        self._refine_rows_pending = False
+        row_count = self.model().rowCount()
+        if row_count == 0:
+            return
+        first = max(0, self.rowAt(0))
+        last = self.rowAt(self.viewport().height() - 1)
+        if last < 0:
+            last = row_count - 1
+        delegate: MessageDelegate = self.itemDelegate()
+        messages = self.model().messages
+        header = self.verticalHeader()
+        width = self.rows_width
+        for row in range(first, last + 1):
+            height = delegate.height(messages[row], width)
+            if header.sectionSize(row) != height:
+                header.resizeSection(row, height)
+            self.want_replies(messages[row])
+
+    def want_replies(self, message: dict):
+        if not is_thread_parent(message):
+            return
+        key = (message["ts"], message.get("latest_reply"))
+        if key not in self._replies_wanted:
+            self._replies_wanted.add(key)
+            self.replies_wanted.emit(message)
+
+    def wheelEvent(self, event):
+        if event.modifiers() == Qt.KeyboardModifier.ControlModifier:
+            delta = event.angleDelta().y() / 120  # Typically, one wheel step is 120 units
+            self.change_font_size(int(delta))
+        else:
+            super().wheelEvent(event)  # Call the base class implementation for normal scrolling
+
+    def keyPressEvent(self, event):
+        if event.modifiers() == Qt.KeyboardModifier.ControlModifier:
+            if event.key() == Qt.Key.Key_Plus or event.key() == Qt.Key.Key_Equal:
+                self.change_font_size(1)
+                return
+            elif event.key() == Qt.Key.Key_Minus:
+                self.change_font_size(-1)
+                return
+        super().keyPressEvent(event)
+
+    def change_font_size(self, delta: int):
+        self.default_font_size = max(1, self.default_font_size + delta)
+        self.itemDelegate().set_font_size(self.default_font_size)
+        self.size_all_rows()
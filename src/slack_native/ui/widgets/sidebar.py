@@ -5,18 +5,17 @@ from typing import List, Union
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QPushButton, QStackedWidget
 from qt_async_threads import QtAsyncRunner
 
+from utils.tracing import tracer
+
 lazy_loaded = {}
 
 
 # make a decorator to run when a button is clicked
 async def on_button_click(contentStack: QStackedWidget, i, func: callable):
-    # Print debug information about current widget and index
-    print(f"Index: {i}")
+    tracer.instant("sidebar_button", "ui", index=i)
     widget = contentStack.widget(i)
-    print(f"Widget at index {i}: {widget}")
 
     if lazy_loaded.get(i):
-        print("Widget already loaded")
         contentStack.setCurrentIndex(i)
         return
 
@@ -28,21 +27,10 @@ async def on_button_click(contentStack: QStackedWidget, i, func: callable):
             await func(widget)
         else:
             func(widget)
-    else:
-        print("No function to run")
 
-    # Print debug information before inserting the widget
-    print(f"Inserting widget at index {i}")
-    print(f"Widget to insert: {widget}")
-    index = contentStack.insertWidget(i, widget)
-    print(f"Inserted widget at index {index}")
+    contentStack.insertWidget(i, widget)
     contentStack.setCurrentIndex(i)
 
-    # Print all widgets in contentStack for verification
-    print("Current widgets in contentStack:")
-    for index in range(contentStack.count()):
-        print(f"Index {index}: {contentStack.widget(index)}")
-
 
 class SideBar(QWidget):
     contentStack = None
@@ -26,7 +26,6 @@ class TextBrowser(QTextBrowser):
                 self.change_font_size(-1)
 
     def change_font_size(self, delta):
-        print(delta)
         self.default_font_size += delta
         self.default_font_size = max(1, self.default_font_size)
         cursor = self.textCursor()
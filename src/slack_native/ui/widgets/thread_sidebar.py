@@ -1,13 +1,23 @@
 from typing import List
 
 from PySide6.QtCore import Signal, QObject
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel, QScrollArea
+from PySide6.QtWidgets import QWidget, QVBoxLayout, QLabel
 from qt_async_threads import QtAsyncRunner
 
 from ui.widgets.messages_browser import MessagesBrowser
 from slack_client import slack_client
 
 
+async def show_replies(message: dict, parent: QWidget):
+    from messages.fetch import fetch_replies
+    if not parent.findChild(ThreadSidebar):
+        replies_widget = ThreadSidebar(message["channel"], parent)
+    else:
+        replies_widget = parent.findChild(ThreadSidebar)
+    replies = await fetch_replies(slack_client, message["channel"], message["ts"], message.get("latest_reply"))
+    replies_widget.thread_sidebar_updated.thread_sidebar_updated.emit(replies)
+
+
 class ThreadSidebarUpdated(QObject):
     thread_sidebar_updated = Signal(list)
 
@@ -35,7 +45,5 @@ class ThreadSidebar(QWidget):
         layout.addWidget(self.messages_browser)
 
     async def update_thread_sidebar_ui(self, messages: List[dict]):
-        scroll_area: QScrollArea = self.messages_browser.messages_browser
-        scroll_area.children().clear()
         from messages.render import render_messages
-        await render_messages(scroll_area, messages)
\ No newline at end of file
+        await render_messages(self.messages_browser.messages_view, messages, replace=True)
\ No newline at end of file
@@ -0,0 +1,139 @@
+import threading
+from typing import Callable
+
+from PySide6.QtCore import QObject, QTimer, Signal
+from qt_async_threads import QtAsyncRunner
+
+from messages.store import message_store
+
+# ~60 updates per second at most
+FRAME_INTERVAL_MS = 16
+# the most events waiting to be flushed; past this, a channel's pending events are dropped and it's re-synced
+MAX_PENDING_EVENTS = 5000
+
+
+def event_ts(event: dict) -> str:
+    """The `ts` of the message a `message` event is about."""
+    subtype = event.get("subtype")
+    if subtype == "message_deleted":
+        return event["deleted_ts"]
+    if subtype == "message_changed":
+        return event["message"]["ts"]
+    return event["ts"]
+
+
+def merge_events(previous: dict, event: dict) -> dict:
+    """Combine two events about the same message into one with the same end result."""
+    subtype = event.get("subtype")
+    previous_subtype = previous.get("subtype")
+    if subtype == "message_changed":
+        if previous_subtype == "message_deleted":
+            return previous
+        if previous_subtype is None:
+            # a message edited before it was ever shown is just a new message with the edited content
+            return dict(event["message"], channel=event["channel"])
+    return event
+
+
+class UpdateBus(QObject):
+    """Buffers incoming message events and hands them to the UI at most once per frame.
+
+    Events can be posted from any thread. They're batched per channel, and events about the same message are merged,
+    so a burst of events costs one store transaction and one update per channel rather than one per event.
+    """
+    _wake = Signal()
+
+    def __init__(self, on_channel_updated: Callable[[str], None], frame_interval: int = FRAME_INTERVAL_MS,
+                 max_pending: int = MAX_PENDING_EVENTS):
+        super().__init__()
+        self.on_channel_updated = on_channel_updated
+        self.frame_interval = frame_interval
+        self.max_pending = max_pending
+        self.runner = QtAsyncRunner()
+        self._lock = threading.Lock()
+        # channel -> ts -> the pending event about that message
+        self._pending: dict[str, dict[str, dict]] = {}
+        # channels whose events were dropped, to be re-synced from scratch
+        self._overflowed: set[str] = set()
+        self._depth = 0
+        self._scheduled = False
+        self._flushing = False
+        self._timer: QTimer | None = None
+        self.counters = {"posted": 0, "merged": 0, "dropped": 0, "flushes": 0, "max_queue_depth": 0}
+        # emitted from the posting thread, handled on the thread the bus lives in
+        self._wake.connect(self._schedule)
+
+    def post(self, event: dict):
+        channel_id = event["channel"]
+        ts = event_ts(event)
+        with self._lock:
+            self.counters["posted"] += 1
+            if channel_id in self._overflowed:
+                self.counters["dropped"] += 1
+            else:
+                events = self._pending.setdefault(channel_id, {})
+                previous = events.get(ts)
+                if previous is not None:
+                    events[ts] = merge_events(previous, event)
+                    self.counters["merged"] += 1
+                elif self._depth >= self.max_pending:
+                    self.counters["dropped"] += len(events) + 1
+                    self._depth -= len(events)
+                    del self._pending[channel_id]
+                    self._overflowed.add(channel_id)
+                else:
+                    events[ts] = event
+                    self._depth += 1
+                    self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self._depth)
+            wake = not self._scheduled
+            self._scheduled = True
+        if wake:
+            self._wake.emit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, queue_depth=self._depth)
+
+    def _schedule(self):
+        # a flush that is being applied reschedules itself once it's done, so batches are applied in order
+        if self._flushing:
+            return
+        if self._timer is None:
+            self._timer = QTimer(self)
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self._flush)
+        if not self._timer.isActive():
+            self._timer.start(self.frame_interval)
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            overflowed, self._overflowed = self._overflowed, set()
+            self._depth = 0
+            self._scheduled = False
+        if not pending and not overflowed:
+            return
+        self.counters["flushes"] += 1
+        self._flushing = True
+        self.runner.start_coroutine(self._apply(pending, overflowed))
+
+    async def _apply(self, pending: dict[str, dict[str, dict]], overflowed: set[str]):
+        try:
+            await self.runner.run(self._write, pending, overflowed)
+            for channel_id in list(pending) + [channel_id for channel_id in overflowed if channel_id not in pending]:
+                self.on_channel_updated(channel_id)
+        finally:
+            self._flushing = False
+            with self._lock:
+                has_pending = self._scheduled
+            if has_pending:
+                self._schedule()
+
+    @staticmethod
+    def _write(pending: dict[str, dict[str, dict]], overflowed: set[str]):
+        events = [event for channel_events in pending.values() for event in channel_events.values()]
+        if events:
+            message_store.apply_events(events)
+        for channel_id in overflowed:
+            # some of the channel's events were lost, so its history is fetched again when it's next shown
+            message_store.clear(channel_id)
@@ -0,0 +1,128 @@
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from users.cache import cache_profile_picture
+from utils.single_flight import SingleFlight
+from utils.tracing import traced, tracer
+
+# the size avatars are drawn at next to messages, in logical pixels
+AVATAR_SIZE = 48
+# the square `image_<size>` renditions of a profile picture that Slack serves
+SLACK_AVATAR_SIZES = (24, 32, 48, 72, 192, 512)
+
+
+def avatar_pixels(device_pixel_ratio: float, size: int = AVATAR_SIZE) -> int:
+    """The size, in device pixels, an avatar is drawn at on a display with the given device pixel ratio."""
+    return round(size * device_pixel_ratio)
+
+
+def device_pixel_ratio() -> float:
+    """The highest device pixel ratio of the connected screens, so avatars stay sharp on any of them.
+
+    Must be called from the UI thread; 1 if there's no application yet.
+    """
+    from PySide6.QtGui import QGuiApplication
+    if QGuiApplication.instance() is None:
+        return 1.0
+    return max((screen.devicePixelRatio() for screen in QGuiApplication.screens()), default=1.0)
+
+
+def avatar_resolution(profile: dict, pixels: int) -> str:
+    """The smallest `image_<size>` of a profile that is at least `pixels` wide, or the largest one it has."""
+    available = [size for size in SLACK_AVATAR_SIZES if profile.get(f"image_{size}")]
+    if not available:
+        return str(AVATAR_SIZE)
+    return str(next((size for size in available if size >= pixels), available[-1]))
+
+
+@traced("downscale_avatar", "avatar")
+def downscale(image: bytes, pixels: int) -> bytes:
+    """Scale an image down to `pixels` x `pixels` and encode it as PNG; safe to call from a worker thread."""
+    from PySide6.QtCore import QBuffer, QByteArray, QIODevice, Qt
+    from PySide6.QtGui import QImage
+
+    decoded = QImage()
+    if not decoded.loadFromData(image):
+        raise ValueError("unreadable profile picture")
+    if decoded.width() > pixels or decoded.height() > pixels:
+        decoded = decoded.scaled(pixels, pixels, Qt.AspectRatioMode.KeepAspectRatio,
+                                 Qt.TransformationMode.SmoothTransformation)
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+    decoded.save(buffer, "PNG")
+    buffer.close()
+    return data.data()
+
+
+class AvatarFetcher:
+    """Downloads profile pictures over a pooled HTTP session, scales them down once and writes them to the cache.
+
+    At most `max_workers` downloads run at once, and concurrent requests for the same URL and size share a single
+    download (whose result is reused for `ttl` seconds).
+    """
+
+    def __init__(self, max_workers: int = 8, timeout: float = 10, ttl: float = 60):
+        self.timeout = timeout
+        self.max_workers = max_workers
+        # created with the first download, so importing `requests` doesn't slow startup down
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="avatar")
+        self._flight = SingleFlight(ttl=ttl)
+        # (url, seconds) of the most recent downloads
+        self.timings: deque[tuple[str, float]] = deque(maxlen=1000)
+        # downloads that failed, or whose image couldn't be read
+        self.failures = 0
+
+    @property
+    def session(self):
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                # keep one connection per worker alive, so each avatar doesn't pay for a new TCP + TLS handshake
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def fetch(self, user_id: str, url: str, pixels: int) -> Future:
+        """Return a future resolving to the cached path of the user's profile picture, at `pixels` x `pixels`."""
+        return self._flight.submit((url, pixels), self._pool, self._download, user_id, url, pixels)
+
+    def _download(self, user_id: str, url: str, pixels: int) -> str:
+        start = time.perf_counter()
+        try:
+            with tracer.span("download_avatar", "avatar", user=user_id, pixels=pixels):
+                response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            self.timings.append((url, time.perf_counter() - start))
+            return cache_profile_picture(user_id, str(pixels), downscale(response.content, pixels), url)
+        except Exception:
+            self.failures += 1
+            raise
+
+    def stats(self) -> dict:
+        durations = sorted(duration for _, duration in list(self.timings))
+        flight = self._flight.stats()
+        if not durations:
+            return {"count": 0, "failures": self.failures, "shared": flight["shared"], "cached": flight["cached"]}
+        return {
+            "count": len(durations),
+            "failures": self.failures,
+            "shared": flight["shared"],
+            "cached": flight["cached"],
+            "mean": statistics.fmean(durations),
+            "p50": durations[len(durations) // 2],
+            "p95": durations[min(len(durations) - 1, int(len(durations) * 0.95))],
+            "max": durations[-1],
+        }
+
+
+avatar_fetcher = AvatarFetcher()
@@ -0,0 +1,55 @@
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+from users.cache import get_cached_users, cache_users
+
+# members per `users.list` page; Slack recommends no more than 200
+DIRECTORY_PAGE_SIZE = 200
+# how often the directory is refreshed while the app is running
+DIRECTORY_REFRESH_INTERVAL_MS = 60 * 60 * 1000
+
+
+def changed_users(members: list[dict]) -> dict[str, dict]:
+    """The members that are new, or whose `updated` differs from the cached user.
+
+    A changed user keeps their cached profile picture if it was made from an image the new profile still has.
+    """
+    cached = get_cached_users([member["id"] for member in members])
+    changed = {}
+    for member in members:
+        previous = cached.get(member["id"])
+        if previous is not None and previous.get("updated") == member.get("updated"):
+            continue
+        avatar_url = previous["profile"].get("avatar_url") if previous is not None else None
+        if avatar_url and avatar_url in member["profile"].values():
+            for key in ("avatar_url", "avatar_path", "avatar_pixels"):
+                member["profile"][key] = previous["profile"][key]
+        changed[member["id"]] = member
+    return changed
+
+
+def sync_directory(slack_client: WebClient) -> dict:
+    """Page through `users.list` and cache the users that are new or have changed; blocking, so run it off the UI
+    thread.
+
+    Slack can't filter `users.list` by `updated`, so every page is read, but only changed users are written. Returns
+    the number of users seen and changed.
+    """
+    seen = 0
+    changed = 0
+    cursor = None
+    try:
+        while True:
+            response = slack_client.users_list(limit=DIRECTORY_PAGE_SIZE, cursor=cursor)
+            members = response.get("members") or []
+            seen += len(members)
+            users = changed_users(members)
+            cache_users(users)
+            changed += len(users)
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                break
+    # `OSError` covers the transport errors (e.g. `URLError`, timeouts), which would otherwise end the thread silently
+    except (SlackApiError, OSError) as e:
+        print(f"Error syncing the user directory: {e}")
+    return {"seen": seen, "changed": changed}
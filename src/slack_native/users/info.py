@@ -1,12 +1,87 @@
-async def fetch_user_info(slack_client, user_id) -> dict:
+from functools import partial
+from typing import Iterable
+
+from qt_async_threads import QtAsyncRunner
+
+from users.avatars import avatar_fetcher, avatar_resolution
+from users.cache import get_cached_users, cache_users
+from utils.single_flight import SingleFlight
+
+# upper bound on the number of concurrent `users_info` calls per batch
+MAX_PARALLEL_USER_FETCHES = 8
+# batches resolving the same user at the same time (e.g. two channels loading) share one `users_info` call
+user_lookups = SingleFlight(ttl=30)
+
+
+def fetch_user_info(slack_client, user_id) -> dict:
     user_info = slack_client.users_info(user=user_id)
     return user_info["user"]
 
-async def fetch_image(url: str):
-    image = await requests.get(url)
-    image.raise_for_status()
-    return image.content
 
-async def fetch_profile_picture(slack_client, user_id):
-    user_info = await fetch_user_info(slack_client, user_id)
+def fetch_profile_picture(slack_client, user_id):
+    user_info = fetch_user_info(slack_client, user_id)
     return user_info["profile"]["image_48"]
+
+
+def fetch_avatar(user: dict, pixels: int) -> dict:
+    """Return a copy of the user with their profile picture cached at `pixels`; meant to be run in a worker thread.
+
+    The profile keeps Slack's URLs; the cached file is at `avatar_path`, made from `avatar_url` at `avatar_pixels`.
+    If the picture can't be fetched, the user is returned as it is, without a cached picture, so one bad avatar
+    doesn't stop a batch of users from loading; it's tried again the next time the user is resolved.
+    """
+    user = {**user, "profile": dict(user["profile"])}
+    profile = user["profile"]
+    url = profile.get(f"image_{avatar_resolution(profile, pixels)}")
+    if not url:
+        return user
+    try:
+        profile["avatar_path"] = avatar_fetcher.fetch(user["id"], url, pixels).result()
+    except Exception as e:
+        print(f"Error fetching the profile picture of {user['id']}: {e}")
+        return user
+    profile["avatar_url"] = url
+    profile["avatar_pixels"] = pixels
+    return user
+
+
+def fetch_user(slack_client, user_id: str, pixels: int) -> dict:
+    """Fetch a user and cache their profile picture at `pixels`; meant to be run in a worker thread."""
+    return fetch_avatar(fetch_user_info(slack_client, user_id), pixels)
+
+
+def has_profile_urls(user: dict) -> bool:
+    """Whether a cached user can have their profile picture fetched without looking them up again."""
+    # users cached before profiles kept Slack's URLs had `image_48` replaced by the cached file's path
+    return str(user["profile"].get("image_48", "")).startswith(("http://", "https://"))
+
+
+def has_avatar(user: dict, pixels: int) -> bool:
+    """Whether a user's cached profile picture is big enough to be drawn at `pixels` without upscaling."""
+    # users cached before avatars were stored this way don't have one
+    return "avatar_path" in user["profile"] and user["profile"].get("avatar_pixels", 0) >= pixels
+
+
+async def resolve_users(slack_client, user_ids: Iterable[str], pixels: int) -> dict[str, dict]:
+    """Resolve a batch of distinct user IDs, from the cache first and then in parallel from the API.
+
+    Newly fetched users are written to the cache, with their profile pictures scaled to `pixels` and cached. Cached
+    users without a picture big enough for `pixels` (e.g. users from the directory sync, or after moving to a HiDPI
+    screen) only have the picture fetched.
+    """
+    users = get_cached_users(user_ids)
+    missing = [user_id for user_id in user_ids if user_id not in users or not has_profile_urls(users[user_id])]
+    too_small = [user_id for user_id in user_ids if user_id in users and user_id not in missing
+                 and not has_avatar(users[user_id], pixels)]
+    if missing or too_small:
+        runner = QtAsyncRunner(max_threads=min(len(missing) + len(too_small), MAX_PARALLEL_USER_FETCHES))
+        tasks = [partial(user_lookups.call, (user_id, pixels), fetch_user, slack_client, user_id, pixels)
+                 for user_id in missing]
+        tasks += [partial(fetch_avatar, users[user_id], pixels) for user_id in too_small]
+        fetched = {}
+        async for user in runner.run_parallel(tasks):
+            fetched[user["id"]] = user
+        await runner.run(cache_users, fetched)
+        runner.close()
+        users.update(fetched)
+    return users
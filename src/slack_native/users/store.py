@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Iterable
+
+from common import APP_DATA_DIR
+from utils.sqlite_store import SQLiteStore
+
+
+class UserStore(SQLiteStore):
+    """An on-disk user store, keyed by user ID, with an in-memory LRU in front of it."""
+    schema = ("CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, data TEXT NOT NULL)",)
+
+    def __init__(self, path: str, lru_size: int = 2048):
+        super().__init__(path)
+        self.lru_size = lru_size
+        self._lru: OrderedDict[str, dict] = OrderedDict()
+        self._lru_lock = threading.Lock()
+
+    def on_initialized(self):
+        """Import the users of the legacy `users.json` cache, if there is one."""
+        legacy_path = os.path.join(os.path.dirname(self.path), "users.json")
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, "r") as f:
+                users: dict[str, dict] = json.load(f)
+        except (OSError, ValueError):
+            users = {}
+        if users:
+            self.upsert_many(users)
+        os.remove(legacy_path)
+
+    def _remember(self, user_id: str, user: dict):
+        with self._lru_lock:
+            self._lru[user_id] = user
+            self._lru.move_to_end(user_id)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def get(self, user_id: str) -> dict | None:
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids: Iterable[str]) -> dict[str, dict]:
+        users = {}
+        missing = []
+        with self._lru_lock:
+            for user_id in user_ids:
+                if user_id in self._lru:
+                    self._lru.move_to_end(user_id)
+                    users[user_id] = self._lru[user_id]
+                else:
+                    missing.append(user_id)
+        # SQLite limits the number of host parameters per statement, so look the users up in chunks
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.connection().execute(
+                f"SELECT id, data FROM users WHERE id IN ({placeholders})", chunk).fetchall()
+            for user_id, data in rows:
+                user = json.loads(data)
+                users[user_id] = user
+                self._remember(user_id, user)
+        return users
+
+    def upsert_many(self, users: dict[str, dict]):
+        if not users:
+            return
+        rows = [(user_id, json.dumps(user)) for user_id, user in users.items()]
+        connection = self.connection()
+        with self.write_lock, connection:
+            connection.executemany(
+                "INSERT INTO users (id, data) VALUES (?, ?) ON CONFLICT(id) DO UPDATE SET data = excluded.data", rows)
+        for user_id, user in users.items():
+            self._remember(user_id, user)
+
+    def __len__(self):
+        return self.connection().execute("SELECT COUNT(*) FROM users").fetchone()[0]
+
+
+user_store = UserStore(os.path.join(APP_DATA_DIR, "users.db"))
@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PySide6.QtCore import QObject, Signal
+from PySide6.QtGui import QImage, QPixmap
+
+from utils.image_processing import rounded_avatar
+from utils.tracing import tracer
+
+# rounded avatars kept in memory, across every view
+MAX_CACHED_AVATARS = 512
+
+
+class AvatarCache(QObject):
+    """A bounded, shared cache of rounded avatar pixmaps, keyed by (user, size, radius, device pixel ratio).
+
+    A miss returns None straight away and the avatar is decoded, scaled and masked on a worker thread; `loaded` is
+    emitted (on the UI thread) once it can be drawn, so views can repaint.
+    """
+
+    loaded = Signal(object)
+    # (key, path, image) from a worker thread; queued to the thread the cache lives on, where the pixmap is made
+    _decoded = Signal(object, str, object)
+
+    def __init__(self, max_entries: int = MAX_CACHED_AVATARS, max_workers: int = 2):
+        super().__init__()
+        self.max_entries = max_entries
+        # key -> (path the pixmap was made from, pixmap)
+        self._pixmaps: OrderedDict[tuple, tuple[str, QPixmap]] = OrderedDict()
+        self._pending: set[tuple] = set()
+        # (key, path) of images that couldn't be read, so they aren't decoded again on every repaint
+        self._failed: set[tuple] = set()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="avatar-decode")
+        self.hits = 0
+        self.misses = 0
+        self._decoded.connect(self._on_decoded)
+
+    def get(self, user_id: str, path: str, size: int, radius: int, device_pixel_ratio: float) -> QPixmap | None:
+        """Return the avatar if it is ready, otherwise start preparing it and return None."""
+        key = (user_id, size, radius, device_pixel_ratio)
+        entry = self._pixmaps.get(key)
+        # the path changes with the picture's URL, so a different path means the user has a new profile picture
+        if entry is not None and entry[0] == path:
+            self._pixmaps.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        if (key, path) not in self._pending and (key, path) not in self._failed:
+            self._pending.add((key, path))
+            self._pool.submit(self._decode, key, path)
+        return None
+
+    def _decode(self, key: tuple, path: str):
+        _, size, radius, device_pixel_ratio = key
+        try:
+            with tracer.span("decode_avatar", "avatar", user=key[0], size=size):
+                image = rounded_avatar(path, size, radius, device_pixel_ratio)
+        except Exception as e:
+            print(f"Error decoding avatar {path}: {e}")
+            image = None
+        self._decoded.emit(key, path, image)
+
+    def _on_decoded(self, key: tuple, path: str, image: QImage | None):
+        self._pending.discard((key, path))
+        if image is None:
+            self._failed.add((key, path))
+            return
+        self._pixmaps[key] = (path, QPixmap.fromImage(image))
+        self._pixmaps.move_to_end(key)
+        while len(self._pixmaps) > self.max_entries:
+            self._pixmaps.popitem(last=False)
+        self.loaded.emit(key)
+
+    def clear(self):
+        self._pixmaps.clear()
+        self._failed.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._pixmaps),
+            "pending": len(self._pending),
+            "failed": len(self._failed),
+            "bytes": sum(pixmap.width() * pixmap.height() * pixmap.depth() // 8 for _, pixmap in self._pixmaps.values()),
+        }
+
+
+avatar_cache = AvatarCache()
@@ -2,30 +2,27 @@ from PySide6.QtCore import Qt
 from PySide6.QtGui import QImage, QPainter, QBrush
 
 
-class RoundedImage(QImage):
-    def __init__(self, source_path: str | bytes, radius: int):
-        """Return a rounded version of the image."""
-        if isinstance(source_path, str):
-            super().__init__(source_path)
-        else:
-            super().__init__()
-            super().loadFromData(source_path)
-        self.source_path: str | None = None
-        self.radius = radius
-        self.image = super()
-        image = self.image
-        width, height = image.width(), image.height()
+def rounded_avatar(source_path: str, size: int, radius: int, device_pixel_ratio: float = 1.0) -> QImage | None:
+    """Scale an image to `size` x `size` logical pixels and round its corners, ready to be drawn as is.
 
-        # Create a mask image with rounded corners
-        mask = QImage(width, height, QImage.Format.Format_Alpha8)
-        mask.fill(Qt.GlobalColor.transparent)
-
-        # Draw the rounded rectangle
-        painter = QPainter(mask)
-        painter.setBrush(QBrush(Qt.GlobalColor.black))
-        painter.setPen(Qt.GlobalColor.transparent)
-        painter.drawRoundedRect(0, 0, width, height, self.radius, self.radius)
-        painter.end()
-
-        # Apply the mask to the original image
-        image.setAlphaChannel(mask)
+    Safe to call from a worker thread, as it only uses `QImage`; returns None if the image can't be read.
+    """
+    image = QImage(source_path)
+    if image.isNull():
+        return None
+    pixels = round(size * device_pixel_ratio)
+    # scale before masking, so the mask is painted at the final size instead of the source's
+    image = image.scaled(pixels, pixels, Qt.AspectRatioMode.KeepAspectRatio,
+                         Qt.TransformationMode.SmoothTransformation)
+    image = image.convertToFormat(QImage.Format.Format_ARGB32_Premultiplied)
+    rounded = QImage(image.size(), QImage.Format.Format_ARGB32_Premultiplied)
+    rounded.fill(Qt.GlobalColor.transparent)
+    painter = QPainter(rounded)
+    painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+    painter.setBrush(QBrush(image))
+    painter.setPen(Qt.PenStyle.NoPen)
+    painter.drawRoundedRect(0, 0, image.width(), image.height(),
+                            radius * device_pixel_ratio, radius * device_pixel_ratio)
+    painter.end()
+    rounded.setDevicePixelRatio(device_pixel_ratio)
+    return rounded
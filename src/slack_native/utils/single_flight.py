@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from typing import Callable, Hashable
+
+
+class SingleFlight:
+    """Shares one call between all the callers asking for the same key at the same time.
+
+    A successful result is remembered for `ttl` seconds, so callers arriving shortly after get it without a new call;
+    failures are forgotten straight away, so the next caller tries again.
+    """
+
+    def __init__(self, ttl: float = 30, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # key -> (expiry, or None while the call is in flight, future of the result)
+        self._entries: OrderedDict[Hashable, tuple[float | None, Future]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "shared": 0, "cached": 0}
+
+    def _join(self, key: Hashable) -> Future | None:
+        """Return the future of a call in flight or a result still fresh for `key`; must hold the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expiry, future = entry
+        if expiry is None:
+            self.counters["shared"] += 1
+        elif expiry > time.monotonic():
+            self.counters["cached"] += 1
+        else:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return future
+
+    def _start(self, key: Hashable, future: Future):
+        """Register a new call for `key`; must hold the lock."""
+        self.counters["calls"] += 1
+        self._entries[key] = (None, future)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _settle(self, key: Hashable, future: Future):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] is not future:
+                return
+            if future.exception() is not None:
+                del self._entries[key]
+            else:
+                self._entries[key] = (time.monotonic() + self.ttl, future)
+
+    def submit(self, key: Hashable, executor: Executor, fn: Callable, *args) -> Future:
+        """Return a future of `fn(*args)`, run on `executor` unless a call for `key` is in flight or fresh."""
+        with self._lock:
+            future = self._join(key)
+            if future is not None:
+                return future
+            future = executor.submit(fn, *args)
+            self._start(key, future)
+        # registered outside the lock, as the callback runs immediately if the call has already finished
+        future.add_done_callback(lambda done: self._settle(key, done))
+        return future
+
+    def call(self, key: Hashable, fn: Callable, *args):
+        """Return `fn(*args)`, calling it in this thread unless a call for `key` is in flight or fresh."""
+        with self._lock:
+            future = self._join(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                future.set_running_or_notify_cancel()
+                self._start(key, future)
+        if leader:
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+            self._settle(key, future)
+        return future.result()
+
+    def forget(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, entries=len(self._entries))
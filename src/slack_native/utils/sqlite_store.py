@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """Base class for the on-disk stores in the app data directory.
+
+    The database is opened in WAL mode, so readers on any thread are never blocked by the writer.
+    Each thread gets its own connection; writes are serialized through `write_lock`.
+    """
+    schema: tuple[str, ...] = ()
+
+    def __init__(self, path: str):
+        self.path = path
+        self.write_lock = threading.Lock()
+        self._local = threading.local()
+        self._init_lock = threading.RLock()
+        self._initialized = False
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            self._initialize()
+            connection = sqlite3.connect(self.path, timeout=30)
+            self._local.connection = connection
+        return connection
+
+    def _initialize(self):
+        with self._init_lock:
+            if self._initialized:
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            for statement in self.schema:
+                connection.execute(statement)
+            connection.commit()
+            connection.close()
+            self._initialized = True
+            self.on_initialized()
+
+    def on_initialized(self):
+        """Called once, after the schema has been created; a hook for migrations."""
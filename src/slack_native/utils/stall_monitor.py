@@ -0,0 +1,143 @@
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from PySide6.QtCore import QObject, QTimer, Qt
+
+from utils.tracing import tracer
+
+# how often the UI thread is expected to run the heartbeat
+HEARTBEAT_INTERVAL_MS = 100
+# a heartbeat this late is a stall; the UI thread's stack is dumped while it's still stuck
+STALL_THRESHOLD_MS = 250
+# upper bounds of the histogram buckets, in milliseconds; the last bucket has no upper bound
+LAG_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2000, 5000)
+STALL_BUCKETS_MS = (500, 1000, 2000, 5000, 10000)
+# the most recent stalls kept with their stacks
+MAX_RECORDED_STALLS = 50
+
+
+def bucket_labels(bounds: tuple[int, ...]) -> list[str]:
+    return [f"<{bound}ms" for bound in bounds] + [f">={bounds[-1]}ms"]
+
+
+class Histogram:
+    def __init__(self, bounds: tuple[int, ...] = LAG_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+
+    def add(self, value_ms: float):
+        for i, bound in enumerate(self.bounds):
+            if value_ms < bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def as_dict(self) -> dict[str, int]:
+        return dict(zip(bucket_labels(self.bounds), self.counts))
+
+
+class StallMonitor(QObject):
+    """Measures how late the Qt event loop runs a heartbeat timer, to catch the UI freezing.
+
+    A watchdog thread checks the heartbeat; once it is `threshold_ms` late, the UI thread's stack is printed (while
+    it's still stuck, so the culprit is on it) and kept with the stall. The lag of every beat and the duration of every
+    stall go into histograms, which `stats` returns at any time.
+    """
+
+    def __init__(self, interval_ms: int = HEARTBEAT_INTERVAL_MS, threshold_ms: int = STALL_THRESHOLD_MS,
+                 parent: QObject | None = None):
+        super().__init__(parent)
+        self.interval_ms = interval_ms
+        self.threshold_ms = threshold_ms
+        self._main_thread = threading.get_ident()
+        self._lock = threading.Lock()
+        self._last_beat = time.monotonic()
+        # the first beat only runs once the event loop starts, however long after `start` that is
+        self._first_beat = True
+        # the stack captured by the watchdog during the current stall, if any
+        self._stall_stack: list[str] | None = None
+        self.beats = 0
+        self.lag_histogram = Histogram()
+        self.stall_histogram = Histogram(STALL_BUCKETS_MS)
+        self.total_stall_ms = 0.0
+        self.max_lag_ms = 0.0
+        self.recent_lags: deque[float] = deque(maxlen=1000)
+        self.stalls: deque[dict] = deque(maxlen=MAX_RECORDED_STALLS)
+        self._stopped = threading.Event()
+        self._watchdog: threading.Thread | None = None
+        self._timer = QTimer(self)
+        self._timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._beat)
+
+    def start(self):
+        self._last_beat = time.monotonic()
+        self._first_beat = True
+        self._timer.start()
+        self._stopped.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="stall-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._timer.stop()
+        self._stopped.set()
+
+    def _beat(self):
+        """Runs on the UI thread."""
+        now = time.monotonic()
+        with self._lock:
+            if self._first_beat:
+                # measuring starts here, rather than counting the time before the event loop ran as a stall
+                self._first_beat = False
+                self._last_beat = now
+                self._stall_stack = None
+                return
+            lag_ms = max(0.0, (now - self._last_beat) * 1000 - self.interval_ms)
+            self._last_beat = now
+            stack = self._stall_stack
+            self._stall_stack = None
+            self.beats += 1
+            self.recent_lags.append(lag_ms)
+            self.lag_histogram.add(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms < self.threshold_ms:
+                return
+            self.stall_histogram.add(lag_ms)
+            self.total_stall_ms += lag_ms
+            self.stalls.append({"at": time.time(), "duration_ms": lag_ms, "stack": stack})
+        tracer.instant("stall", "stall", duration_ms=lag_ms)
+
+    def _watch(self):
+        """Runs on the watchdog thread."""
+        while not self._stopped.wait(self.interval_ms / 1000):
+            with self._lock:
+                late_ms = (time.monotonic() - self._last_beat) * 1000 - self.interval_ms
+                if self._first_beat or late_ms < self.threshold_ms or self._stall_stack is not None:
+                    continue
+                frame = sys._current_frames().get(self._main_thread)
+                self._stall_stack = traceback.format_stack(frame) if frame is not None else []
+                stack = self._stall_stack
+            print(f"UI thread stalled for {late_ms:.0f} ms so far, at:\n{''.join(stack)}", file=sys.stderr)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lags = sorted(self.recent_lags)
+            return {
+                "beats": self.beats,
+                "interval_ms": self.interval_ms,
+                "threshold_ms": self.threshold_ms,
+                "lag_ms": {
+                    "p50": lags[len(lags) // 2] if lags else 0.0,
+                    "p95": lags[min(len(lags) - 1, int(len(lags) * 0.95))] if lags else 0.0,
+                    "p99": lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0,
+                    "max": self.max_lag_ms,
+                },
+                "lag_histogram": self.lag_histogram.as_dict(),
+                "stalls": sum(self.stall_histogram.counts),
+                "total_stall_ms": self.total_stall_ms,
+                "stall_histogram": self.stall_histogram.as_dict(),
+                "recent_stalls": list(self.stalls),
+            }
@@ -0,0 +1,101 @@
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimeline:
+    """Records how long each phase of startup takes, and each module imported along the way.
+
+    Only active when the `STARTUP_PROFILE` environment variable is set; otherwise every method returns straight away.
+    The import hook is removed again by `finish`, so it costs nothing once the app is up.
+    """
+
+    def __init__(self, enabled: bool):
+        self.enabled = enabled
+        self.start = time.perf_counter()
+        # (name, start, duration), relative to `start`
+        self.phases: list[tuple[str, float, float]] = []
+        self.marks: list[tuple[str, float]] = []
+        # (module, start, cumulative duration, self duration, depth)
+        self.imports: list[tuple[str, float, float, float, int]] = []
+        self._original_import = None
+        # only the main thread's imports are timed, as imports on other threads would interleave with them
+        self._main_thread = threading.get_ident()
+        # for each import in progress, the time spent in the imports it triggered
+        self._import_stack: list[float] = []
+        self.finished = False
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0 or name in sys.modules or threading.get_ident() != self._main_thread:
+            return self._original_import(name, globals, locals, fromlist, level)
+        start = time.perf_counter()
+        self._import_stack.append(0.0)
+        try:
+            return self._original_import(name, globals, locals, fromlist, level)
+        finally:
+            duration = time.perf_counter() - start
+            children = self._import_stack.pop()
+            if self._import_stack:
+                self._import_stack[-1] += duration
+            self.imports.append((name, start - self.start, duration, duration - children, len(self._import_stack)))
+
+    def install_import_hook(self):
+        if self.enabled and self._original_import is None:
+            self._original_import = builtins.__import__
+            builtins.__import__ = self._import
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, start - self.start, time.perf_counter() - start))
+
+    def mark(self, name: str):
+        if self.enabled:
+            self.marks.append((name, time.perf_counter() - self.start))
+
+    def report(self, top_imports: int = 25) -> dict:
+        slowest = sorted(self.imports, key=lambda entry: entry[3], reverse=True)[:top_imports]
+        return {
+            "phases": [{"name": name, "start_ms": start * 1000, "duration_ms": duration * 1000}
+                       for name, start, duration in self.phases],
+            "marks": [{"name": name, "at_ms": at * 1000} for name, at in self.marks],
+            "imports": [{"module": module, "start_ms": start * 1000, "cumulative_ms": cumulative * 1000,
+                         "self_ms": own * 1000, "depth": depth}
+                        for module, start, cumulative, own, depth in slowest],
+        }
+
+    def finish(self, path: str | None = None):
+        """Stop recording, print the timeline and, if a path is given, write it there as JSON."""
+        if not self.enabled or self.finished:
+            return
+        self.finished = True
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+        report = self.report()
+        print("Startup timeline:")
+        for phase in report["phases"]:
+            print(f"  {phase['start_ms']:8.1f} ms  {phase['duration_ms']:8.1f} ms  {phase['name']}")
+        for mark in report["marks"]:
+            print(f"  {mark['at_ms']:8.1f} ms  {'':>11}  {mark['name']}")
+        print("Slowest imports (self time / cumulative):")
+        for entry in report["imports"]:
+            print(f"  {entry['self_ms']:8.1f} ms  {entry['cumulative_ms']:8.1f} ms  {entry['module']}")
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+
+
+startup_timeline = StartupTimeline(enabled=bool(os.environ.get("STARTUP_PROFILE")))
+startup_timeline.install_import_hook()
@@ -0,0 +1,149 @@
+import atexit
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from common import APP_DATA_DIR
+
+# the most events kept; the oldest are dropped past this, so a long session can't use up memory
+MAX_TRACE_EVENTS = 500_000
+# returned by `span` while tracing is off; entering and leaving it does nothing
+_NO_SPAN = nullcontext()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *_):
+        end = time.perf_counter_ns()
+        self.tracer.add("X", self.name, self.category, self.start, self.args, dur=(end - self.start) / 1000)
+
+
+class AsyncSpan:
+    """A span that may be suspended, recorded as an async begin/end pair, which viewers draw on a track of its own."""
+    __slots__ = ("tracer", "name", "category", "args", "id")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.id = next(self.tracer.async_ids)
+        self.tracer.add("b", self.name, self.category, time.perf_counter_ns(), self.args, id=self.id)
+        return self
+
+    def __exit__(self, *_):
+        self.tracer.add("e", self.name, self.category, time.perf_counter_ns(), id=self.id)
+
+
+class Tracer:
+    """Records spans of the app's work (fetch, parse, avatar, cache and render) in the Chrome trace event format.
+
+    Only active when the `TRACE` environment variable is set, and the trace is written when the app exits; open it
+    in `chrome://tracing` or Perfetto. While it's off, `span` returns a shared no-op context manager and `traced`
+    leaves functions as they are, so the instrumentation costs next to nothing.
+    """
+
+    def __init__(self, enabled: bool, max_events: int = MAX_TRACE_EVENTS):
+        self.enabled = enabled
+        self.events: deque[dict] = deque(maxlen=max_events)
+        self.pid = os.getpid()
+        self._origin = time.perf_counter_ns()
+        self._thread_names: dict[int, str] = {}
+        # ids pairing the begin and end of async spans; `next` on a count is atomic
+        self.async_ids = itertools.count(1)
+
+    def add(self, phase: str, name: str, category: str, start: int, args: dict | None = None, **fields):
+        tid = threading.get_ident()
+        if tid not in self._thread_names:
+            self._thread_names[tid] = threading.current_thread().name
+        event = {"ph": phase, "name": name, "cat": category, "ts": (start - self._origin) / 1000, "pid": self.pid,
+                 "tid": tid, **fields}
+        if args:
+            event["args"] = args
+        # appending to a deque is atomic, so spans can end on any thread
+        self.events.append(event)
+
+    def span(self, name: str, category: str, **args):
+        """Time a block: `with tracer.span("fetch_messages", "fetch", channel=channel_id): ...`."""
+        if not self.enabled:
+            return _NO_SPAN
+        return Span(self, name, category, args)
+
+    def async_span(self, name: str, category: str, **args):
+        """Time a block that awaits, e.g. a coroutine on the UI thread.
+
+        Coroutines interleave on the same thread, so their spans overlap without nesting; complete spans ("X") can't
+        show that, so these are recorded as async events instead.
+        """
+        if not self.enabled:
+            return _NO_SPAN
+        return AsyncSpan(self, name, category, args)
+
+    def instant(self, name: str, category: str, **args):
+        """Mark a point in time, e.g. a channel being selected."""
+        if self.enabled:
+            self.add("i", name, category, time.perf_counter_ns(), args, s="t")
+
+    def counter(self, name: str, **values: float):
+        """Record values to be drawn as a graph, e.g. a cache's size."""
+        if self.enabled:
+            self.add("C", name, "counter", time.perf_counter_ns(), values)
+
+    def export(self, path: str):
+        """Write the recorded events as a Chrome trace (JSON object format)."""
+        metadata = [{"ph": "M", "name": "thread_name", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                    for tid, name in list(self._thread_names.items())]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + list(self.events), "displayTimeUnit": "ms"}, f)
+
+
+def traced(name: str, category: str):
+    """Decorator putting every call of a function (or coroutine function, as an async span) in a span.
+
+    The function is returned unchanged while tracing is off, so it can be used on hot paths.
+    """
+
+    def decorator(func):
+        if not tracer.enabled:
+            return func
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracer.async_span(name, category):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name, category):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+tracer = Tracer(enabled=bool(os.environ.get("TRACE")))
+if tracer.enabled:
+    atexit.register(tracer.export, os.path.join(APP_DATA_DIR, "trace.json"))